@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Convert a directory (or glob) of PDFs ahead of time, so later uploads of the
+same files are served from the conversion cache. Run from backend/, like the
+server, so both use the same output directory:
+
+    python batch_ingest.py ~/manuals --workers 4
+    python batch_ingest.py "scans/**/*.pdf" --render-pages
+
+Every finished or failed document is appended to a manifest; rerunning the
+same command skips what is already done and still in the conversion cache.
+Workers never evict cache entries (they cannot see what the server is
+serving); the server enforces CONVERSION_CACHE_MB on its next conversion.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+DEFAULT_MANIFEST = Path("output") / "batch_manifest.jsonl"
+
+
+def find_pdfs(inputs):
+    """PDF paths from directories (searched recursively), globs and plain files, deduplicated."""
+    paths = {}
+    for pattern in inputs:
+        path = Path(pattern).expanduser()
+        if path.is_dir():
+            matches = path.rglob("*.pdf")
+        elif path.is_file():
+            matches = [path]
+        else:
+            matches = (Path(p) for p in glob.glob(str(path), recursive=True))
+        for match in matches:
+            if match.suffix.lower() == ".pdf":
+                paths.setdefault(str(match.resolve()), match.resolve())
+    return sorted(paths.values())
+
+
+def read_manifest(manifest_path):
+    """Latest manifest record per source path. A torn last line from an interrupted run is ignored."""
+    records = {}
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                records[record["path"]] = record
+    return records
+
+
+def is_done(record):
+    """A manifest record counts as done only while its conversion cache entry still exists."""
+    if record is None or record.get("status") != "done" or "cache_entry" not in record:
+        return False
+    return (Path(record["cache_entry"]) / "structure.json").exists()
+
+
+def _init_worker(render_pages):
+    # main reads its configuration at import time, so set it before the first import
+    os.environ["EAGER_PAGE_RENDER"] = "1" if render_pages else "0"
+    os.environ["PAGE_WORKERS"] = "1"  # pages render inside this worker, not in a nested pool
+    os.environ["CONVERSION_CACHE_EVICT"] = "0"
+
+
+def ingest(pdf_path):
+    """Convert one PDF into its conversion cache entry. Runs in a worker process."""
+    import main as backend
+
+    start = time.perf_counter()
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(backend.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    doc_id = digest.hexdigest()
+    artifacts_dir = backend.conversion_cache.entry_dir(doc_id, backend.options_fingerprint())
+    structure = backend.conversion_cache.load_structure(artifacts_dir)
+    if structure is not None:
+        return {"doc_id": doc_id, "cache_entry": str(artifacts_dir), "pages": structure["pages_count"],
+                "cached": True, "seconds": round(time.perf_counter() - start, 3)}
+
+    session = backend.create_session(pdf_path.name, doc_id=doc_id, artifacts_dir=artifacts_dir)
+    session.pdf_path = pdf_path
+    try:
+        backend.process_pdf(session)
+        pages = session.pages_count
+    finally:
+        backend.session_store.remove(doc_id)
+    return {"doc_id": doc_id, "cache_entry": str(artifacts_dir), "pages": pages, "cached": False,
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="directories, glob patterns or PDF files")
+    parser.add_argument("--workers", type=int, default=2, help="conversion processes (each loads its own models)")
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST)
+    parser.add_argument("--render-pages", action="store_true", help="also render page images during ingestion")
+    parser.add_argument("--retry-failed", action="store_true", help="retry documents that failed in an earlier run")
+    args = parser.parse_args()
+
+    pdfs = find_pdfs(args.inputs)
+    records = read_manifest(args.manifest)
+    todo = [
+        p for p in pdfs
+        if not is_done(records.get(str(p)))
+        and (args.retry_failed or records.get(str(p), {}).get("status") != "failed")
+    ]
+    print(f"{len(pdfs)} PDFs found, {len(pdfs) - len(todo)} already in {args.manifest}, {len(todo)} to process")
+    if not todo:
+        return
+
+    args.manifest.parent.mkdir(parents=True, exist_ok=True)
+    done = failed = cached = pages = 0
+    start = time.perf_counter()
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(args.render_pages,),
+    )
+    try:
+        with open(args.manifest, "a", encoding="utf-8") as manifest:
+            futures = {pool.submit(ingest, pdf): pdf for pdf in todo}
+            for future in as_completed(futures):
+                pdf = futures[future]
+                record = {"path": str(pdf), "finished_at": time.time()}
+                try:
+                    record.update(future.result(), status="done")
+                    done += 1
+                    cached += record["cached"]
+                    if not record["cached"]:
+                        pages += record["pages"] or 0
+                    note = "cached" if record["cached"] else f"{record['seconds']}s"
+                    print(f"[{done + failed}/{len(todo)}] {pdf.name}: {record['pages']} pages, {note}")
+                except Exception as e:
+                    record.update(status="failed", error=str(e))
+                    failed += 1
+                    print(f"[{done + failed}/{len(todo)}] {pdf.name}: failed: {e}")
+                manifest.write(json.dumps(record) + "\n")
+                manifest.flush()
+    except KeyboardInterrupt:
+        print("Interrupted; finished documents are in the manifest and will be skipped next run.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{done} done ({cached} cached), {failed} failed in {elapsed:.1f}s: "
+        f"{(done - cached) / elapsed:.2f} docs/s, {pages / elapsed:.1f} pages/s converted"
+    )
+
+
+if __name__ == "__main__":
+    main()
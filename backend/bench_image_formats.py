@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compare page image encodings (PNG, WebP, JPEG at several qualities) by bytes
+per page and encode time, at full resolution and at the preview tier:
+
+    python bench_image_formats.py manual.pdf --pages 20
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from page_render import save_image
+
+ENCODINGS = [("png", None), ("webp", 60), ("webp", 80), ("webp", 90), ("jpeg", 75), ("jpeg", 85), ("jpeg", 95)]
+
+
+def rasterize(pdf_path, dpi, max_pages):
+    with fitz.open(pdf_path) as pdf:
+        for page in list(pdf)[:max_pages]:
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+            yield np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[..., :3].copy()
+
+
+def measure(images, image_format, quality):
+    total_bytes = 0
+    start = time.perf_counter()
+    for image in images:
+        buffer = io.BytesIO()
+        save_image(image, buffer, image_format, quality or 80)
+        total_bytes += buffer.tell()
+    return total_bytes / len(images), (time.perf_counter() - start) / len(images) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--preview-factor", type=int, default=3)
+    args = parser.parse_args()
+
+    full = list(rasterize(args.pdf, args.dpi, args.pages))
+    previews = [Image.fromarray(image).reduce(args.preview_factor) for image in full]
+    print(f"{args.pdf.name}: {len(full)} pages at {args.dpi} dpi, previews at 1/{args.preview_factor}")
+    print(f"{'format':<10} {'KB/page':>9} {'ms/page':>8} {'preview KB':>11} {'preview ms':>11}")
+    for image_format, quality in ENCODINGS:
+        size, ms = measure(full, image_format, quality)
+        preview_size, preview_ms = measure(previews, image_format, quality)
+        label = image_format if quality is None else f"{image_format} q{quality}"
+        print(f"{label:<10} {size / 1024:>9.1f} {ms:>8.1f} {preview_size / 1024:>11.1f} {preview_ms:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark eager page rendering (rasterize + overlay + boxes JSON) across
+process-pool sizes. Use a 200+ page PDF to see how throughput scales:
+
+    python bench_page_pool.py manual.pdf --max-workers 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from page_render import render_pages
+
+
+def build_tasks(pdf_path, out_dir, dpi):
+    """One task per page, with a synthetic overlay grid standing in for Docling boxes."""
+    tasks = []
+    with fitz.open(pdf_path) as pdf:
+        for page_no, page in enumerate(pdf):
+            zoom = dpi / 72
+            width, height = page.rect.width * zoom, page.rect.height * zoom
+            rects = [
+                (col * width / 2 + 20, row * height / 10 + 10, width / 2 - 40, height / 10 - 20)
+                for row in range(10) for col in range(2)
+            ]
+            tasks.append({
+                "pdf_path": str(pdf_path),
+                "page_no": page_no,
+                "dpi": dpi,
+                "rects": rects,
+                "page_image_path": str(out_dir / f"page_{page_no}.png"),
+                "annotated_image_path": str(out_dir / f"annotated_page_{page_no}.png"),
+                "blocks": [{"self_ref": f"#/texts/{i}", "bbox": list(r)} for i, r in enumerate(rects)],
+                "boxes_path": str(out_dir / f"boxes_{page_no}.json"),
+            })
+    return tasks
+
+
+def run(tasks, workers):
+    start = time.perf_counter()
+    if workers == 1:
+        for _ in render_pages(tasks):
+            pass
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for _ in render_pages(tasks, pool):
+                pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--dpi", type=int, default=150)
+    args = parser.parse_args()
+
+    worker_counts = sorted({1, *[2 ** i for i in range(1, args.max_workers.bit_length())], args.max_workers})
+    with tempfile.TemporaryDirectory() as tmp:
+        tasks = build_tasks(args.pdf, Path(tmp), args.dpi)
+        print(f"{args.pdf.name}: {len(tasks)} pages at {args.dpi} dpi")
+        print(f"{'workers':>7} {'seconds':>8} {'pages/s':>8} {'speedup':>8}")
+        baseline = None
+        for workers in worker_counts:
+            seconds = run(tasks, workers)
+            baseline = baseline or seconds
+            print(f"{workers:>7} {seconds:>8.2f} {len(tasks) / seconds:>8.1f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Compare the XY-cut reading order (reading_order.page_order) with Docling's
+default body order, page by page, and time it. Takes PDFs (converted with
+Docling first) or Docling JSON exports; defaults to the samples in
+backend/output:
+
+    python bench_reading_order.py
+    python bench_reading_order.py paper.pdf output/docling_complete.json
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from reading_order import page_order
+
+SAMPLES_DIR = Path(__file__).parent / "backend" / "output"
+
+
+def load_document(path):
+    """A Docling document as a plain dict, from its JSON export or by converting the PDF."""
+    if path.suffix.lower() == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    from docling.document_converter import DocumentConverter
+    return DocumentConverter().convert(str(path)).document.export_to_dict()
+
+
+def resolve(doc, ref):
+    _, collection, index = ref.split("/")
+    return doc[collection][int(index)]
+
+
+def body_order(doc):
+    """Top-level texts, pictures and tables in Docling's body order, with groups expanded."""
+    refs = []
+    stack = [child["$ref"] for child in reversed(doc["body"]["children"])]
+    while stack:
+        ref = stack.pop()
+        if ref.startswith("#/groups/"):
+            stack.extend(child["$ref"] for child in reversed(resolve(doc, ref).get("children", [])))
+        else:
+            refs.append(ref)
+    return refs
+
+
+def page_boxes(doc):
+    """page_no -> [(ref, (x0, y0, x1, y1))] in Docling order, top-left origin."""
+    heights = {int(no): page["size"]["height"] for no, page in doc.get("pages", {}).items()}
+    pages = {}
+    for ref in body_order(doc):
+        item = resolve(doc, ref)
+        if not item.get("prov"):
+            continue
+        prov = item["prov"][0]
+        bbox = prov["bbox"]
+        height = heights.get(prov["page_no"], 0)
+        if bbox.get("coord_origin", "BOTTOMLEFT") == "BOTTOMLEFT":
+            top, bottom = height - bbox["t"], height - bbox["b"]
+        else:
+            top, bottom = bbox["t"], bbox["b"]
+        pages.setdefault(prov["page_no"], []).append((ref, (bbox["l"], top, bbox["r"], bottom)))
+    return pages
+
+
+def pair_agreement(order):
+    """Fraction of item pairs that keep their relative Docling order (1.0 = identical)."""
+    n = len(order)
+    if n < 2:
+        return 1.0
+    concordant = sum(1 for i in range(n) for j in range(i + 1, n) if order[i] < order[j])
+    return concordant / (n * (n - 1) / 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", type=Path, nargs="*")
+    parser.add_argument("--repeat", type=int, default=20, help="timing runs per page")
+    args = parser.parse_args()
+
+    inputs = args.inputs or sorted(SAMPLES_DIR.glob("*.pdf")) + sorted(SAMPLES_DIR.glob("*/docling_complete.json"))
+    print(f"{'document':<40} {'pages':>5} {'items':>6} {'ms/page':>8} {'max ms':>7} {'agree':>6} {'same':>5}")
+    for path in inputs:
+        pages = page_boxes(load_document(path))
+        items = 0
+        timings = []
+        agreements = []
+        unchanged = 0
+        for boxes in pages.values():
+            rects = [rect for _, rect in boxes]
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                order = page_order(rects)
+            timings.append((time.perf_counter() - start) / args.repeat * 1000)
+            items += len(boxes)
+            agreements.append(pair_agreement(order))
+            unchanged += order == list(range(len(boxes)))
+        if not pages:
+            print(f"{path.name[:40]:<40} no pages with boxes")
+            continue
+        print(
+            f"{path.name[:40]:<40} {len(pages):>5} {items:>6} {sum(timings) / len(timings):>8.2f} "
+            f"{max(timings):>7.2f} {sum(agreements) / len(agreements):>6.2f} {unchanged:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
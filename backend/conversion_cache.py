@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+
+class ConversionCache:
+    """
+    Converted documents on disk, keyed by PDF content hash plus a fingerprint of
+    the pipeline options. An entry directory holds the serialized
+    DoclingDocument, box files and page images, and is complete once its
+    structure file (reading order, caption maps, overlay geometry) is written.
+    Entries are evicted least recently used first once the cache grows past
+    max_bytes (never, with max_bytes=None). Entry sizes are measured when an
+    entry is first seen (entries written by other processes, such as batch
+    ingestion, are picked up at the next eviction) and again whenever it is
+    saved or loaded here, so eviction never walks the whole tree; files added
+    to an entry in between (lazily rendered pages) are counted at its next
+    load and are bounded by the render cache.
+    """
+
+    STRUCTURE_FILE = "structure.json"
+
+    def __init__(self, root: Path, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = None  # resolved entry dir -> [last used, size in bytes]; scanned on first eviction
+
+    def entry_dir(self, content_hash, options_fingerprint):
+        return self.root / f"{content_hash}-{options_fingerprint}"
+
+    def load_structure(self, entry_dir: Path):
+        """Return the stored structure of a complete entry (marking it recently used), else None."""
+        structure_path = entry_dir / self.STRUCTURE_FILE
+        try:
+            with open(structure_path, "r", encoding="utf-8") as f:
+                structure = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(structure_path)
+        self._track(entry_dir)
+        return structure
+
+    def save_structure(self, entry_dir: Path, structure, pinned=()):
+        """Mark an entry complete, then evict old entries if the cache is over budget."""
+        structure_path = entry_dir / self.STRUCTURE_FILE
+        tmp_path = structure_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(structure, f)
+        os.replace(tmp_path, structure_path)
+        self._track(entry_dir)
+        self.evict(pinned={entry_dir, *pinned})
+
+    def _track(self, entry_dir: Path):
+        # Before the first eviction there is no accounting to update; that scan measures every entry
+        if self._entries is None or self.max_bytes is None:
+            return
+        size = _dir_size(entry_dir)
+        with self._lock:
+            if self._entries is not None:
+                self._entries[entry_dir.resolve()] = [time.time(), size]
+
+    def _scan(self, known):
+        """Tracked entries for the directories on disk now, measuring only those not in known."""
+        entries = {}
+        for entry in self.root.iterdir():
+            if not entry.is_dir():
+                continue
+            entry = entry.resolve()
+            if entry in known:
+                entries[entry] = known[entry]
+                continue
+            structure_path = entry / self.STRUCTURE_FILE
+            last_used = structure_path.stat().st_mtime if structure_path.exists() else entry.stat().st_mtime
+            entries[entry] = [last_used, _dir_size(entry)]
+        return entries
+
+    def evict(self, pinned=()):
+        """Delete least recently used entries until the cache fits max_bytes. pinned entries are kept."""
+        if self.max_bytes is None:
+            return
+        pinned = {Path(p).resolve() for p in pinned}
+        with self._lock:
+            self._entries = self._scan(self._entries or {})
+            total = sum(size for _, size in self._entries.values())
+            for entry, (_, size) in sorted(self._entries.items(), key=lambda e: e[1][0]):
+                if total <= self.max_bytes:
+                    break
+                if entry in pinned:
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+                del self._entries[entry]
+                total -= size
+                print(f"Evicted conversion cache entry {entry.name} ({size} bytes)")
+
+
+def _dir_size(path: Path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
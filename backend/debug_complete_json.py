@@ -5,19 +5,21 @@ Debug script to test complete JSON generation
 
 import requests
 import json
+import sys
 from pathlib import Path
 
 # Configuration
 API_BASE = "http://localhost:8000"
 
-def debug_complete_json():
+def debug_complete_json(doc_id):
     """Debug the complete JSON generation process"""
+    params = {"doc_id": doc_id}
     
     print("=== Debugging Complete JSON Generation ===")
     
     # Step 1: Check if document is processed
     print("\n1. Checking if document is processed...")
-    response = requests.get(f"{API_BASE}/get_reading_order")
+    response = requests.get(f"{API_BASE}/get_reading_order", params=params)
     
     if response.status_code == 200:
         data = response.json()
@@ -30,7 +32,7 @@ def debug_complete_json():
     
     # Step 2: Save complete JSON and markdown
     print("\n2. Saving complete JSON and markdown...")
-    response = requests.post(f"{API_BASE}/save_complete_json_and_markdown")
+    response = requests.post(f"{API_BASE}/save_complete_json_and_markdown", params=params)
     
     if response.status_code == 200:
         result = response.json()
@@ -72,7 +74,7 @@ def debug_complete_json():
     
     # Step 3: Test download endpoint
     print("\n3. Testing download endpoint...")
-    response = requests.get(f"{API_BASE}/download_complete_edited_json")
+    response = requests.get(f"{API_BASE}/download_complete_edited_json", params=params)
     
     if response.status_code == 200:
         print("✅ Download endpoint working!")
@@ -96,4 +98,7 @@ def debug_complete_json():
         print(f"❌ Download endpoint failed: {response.text}")
 
 if __name__ == "__main__":
-    debug_complete_json()
\ No newline at end of file
+    if len(sys.argv) != 2:
+        print("Usage: python debug_complete_json.py <doc_id>")
+    else:
+        debug_complete_json(sys.argv[1])
\ No newline at end of file
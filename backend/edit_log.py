@@ -0,0 +1,139 @@
+import json
+import os
+from pathlib import Path
+
+
+class PatchError(ValueError):
+    """An edit operation that cannot be applied to the current reading order."""
+
+
+def apply_ops(refs, text_dic, ops):
+    """
+    Apply edit operations in place to a reading order (list of refs) and the
+    text edits dict. All operations are validated before any is applied, so a
+    bad batch leaves the state untouched. Supported operations:
+
+        {"op": "move", "ref": r, "after": other}    after=None moves r to the front
+        {"op": "move", "ref": r, "before": other}
+        {"op": "move", "ref": r, "index": i}
+        {"op": "edit_text", "ref": r, "text": "..."}
+    """
+    known = set(refs)
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError(f"Operations must be objects, not {op!r}")
+        kind = op.get("op")
+        if kind == "move":
+            anchors = [key for key in ("after", "before", "index") if key in op]
+            if not isinstance(op.get("ref"), str) or op["ref"] not in known:
+                raise PatchError(f"Unknown ref: {op.get('ref')}")
+            if len(anchors) != 1:
+                raise PatchError("move needs exactly one of after, before or index")
+            anchor = op[anchors[0]]
+            if anchors[0] == "index":
+                if not isinstance(anchor, int) or isinstance(anchor, bool) or not 0 <= anchor < len(refs):
+                    raise PatchError(f"Invalid index: {anchor}")
+            elif anchor is not None and not isinstance(anchor, str):
+                raise PatchError(f"{anchors[0]} must be a ref or null, not {anchor!r}")
+            elif anchor is not None and anchor not in known:
+                raise PatchError(f"Unknown ref: {anchor}")
+            elif anchor == op["ref"]:
+                raise PatchError("Cannot move a ref relative to itself")
+            elif anchor is None and anchors[0] == "before":
+                raise PatchError("before needs a ref")
+        elif kind == "edit_text":
+            if not isinstance(op.get("ref"), str) or not isinstance(op.get("text"), str):
+                raise PatchError("edit_text needs a ref and a text")
+        else:
+            raise PatchError(f"Unknown op: {kind}")
+
+    for op in ops:
+        if op["op"] == "edit_text":
+            text_dic[op["ref"]] = op["text"]
+            continue
+        ref = op["ref"]
+        refs.remove(ref)
+        if "index" in op:
+            refs.insert(min(op["index"], len(refs)), ref)
+        elif "before" in op:
+            refs.insert(refs.index(op["before"]), ref)
+        elif op["after"] is None:
+            refs.insert(0, ref)
+        else:
+            refs.insert(refs.index(op["after"]) + 1, ref)
+
+
+class EditLog:
+    """
+    Append-only log of edit batches next to a full-state snapshot.
+
+    snapshot_path holds {"refs", "texts", "revision"}; log_path holds one JSON
+    line per applied batch ({"revision", "ops"}). Compacting rewrites the
+    snapshot and empties the log, so saves cost O(change) and recovery replays
+    at most compact_every operations.
+    """
+
+    def __init__(self, snapshot_path: Path, log_path: Path, compact_every=500):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compact_every = compact_every
+        self.ops_since_snapshot = 0
+
+    def append(self, revision, ops):
+        with open(self.log_path, "a+b") as f:
+            # Never continue a line left unterminated by a crash mid-append
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write((json.dumps({"revision": revision, "ops": ops}) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self.ops_since_snapshot += len(ops)
+
+    def needs_compaction(self):
+        return self.ops_since_snapshot >= self.compact_every
+
+    def compact(self, refs, text_dic, revision):
+        """Write the full state as the new snapshot and drop the log entries it covers."""
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"refs": refs, "texts": text_dic, "revision": revision}, f)
+        os.replace(tmp_path, self.snapshot_path)
+        self.log_path.unlink(missing_ok=True)
+        self.ops_since_snapshot = 0
+
+    def recover(self, base_refs, base_texts):
+        """
+        Rebuild (refs, texts, revision) from the snapshot, or from the given
+        base state at revision 0 if there is none, plus any logged batches
+        after it. Returns None if nothing was saved yet. A torn last line from
+        a crash mid-append is ignored and cut from the log, so later appends
+        start on a clean line.
+        """
+        if not self.snapshot_path.exists() and not self.log_path.exists():
+            return None
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            refs, texts, revision = snapshot["refs"], snapshot["texts"], snapshot.get("revision", 0)
+        else:
+            refs, texts, revision = list(base_refs), dict(base_texts), 0
+        replayed = 0
+        if self.log_path.exists():
+            with open(self.log_path, "r+b") as f:
+                good_bytes = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        f.truncate(good_bytes)
+                        break
+                    good_bytes += len(line)
+                    if entry["revision"] <= revision:
+                        continue
+                    apply_ops(refs, texts, entry["ops"])
+                    revision = entry["revision"]
+                    replayed += len(entry["ops"])
+        self.ops_since_snapshot = replayed
+        return refs, texts, revision
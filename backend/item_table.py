@@ -0,0 +1,114 @@
+import sys
+
+import numpy as np
+
+KINDS = ("texts", "pictures", "tables")
+TEXT, PICTURE, TABLE = range(len(KINDS))
+
+
+class ItemTable:
+    """
+    Column-oriented copy of the document items that page processing needs,
+    built once from a DoclingDocument so the object graph can be dropped.
+
+    Items (texts, pictures, tables, in document order) get integer ids; their
+    refs are interned strings and their labels indexes into a shared label
+    list. Every provenance of an item is one row, with its page number and
+    (l, t, r, b) bbox in PDF points. Texts are one UTF-8 buffer sliced by
+    offsets, so a large document costs a few arrays instead of a Python
+    object per field.
+    """
+
+    def __init__(self, doc):
+        self.refs = []  # item id -> self_ref
+        self.ids = {}  # self_ref -> item id
+        self.labels = []  # label id -> label string
+        label_ids = {}
+        kinds, item_labels, item_numbers, first_rows = [], [], [], []
+        row_items, row_pages, row_bboxes = [], [], []
+        text_chunks, text_offsets, text_end = [], [0], 0
+
+        for kind, items in enumerate((doc.texts, doc.pictures, doc.tables)):
+            for number, item in enumerate(items):
+                ref = sys.intern(item.self_ref)
+                if ref in self.ids:
+                    continue
+                item_id = self.ids[ref] = len(self.refs)
+                self.refs.append(ref)
+                kinds.append(kind)
+                item_numbers.append(number)
+                label = getattr(item, "label", None)
+                label = None if label is None else str(getattr(label, "value", label))
+                if label not in label_ids:
+                    label_ids[label] = len(self.labels)
+                    self.labels.append(label)
+                item_labels.append(label_ids[label])
+
+                text = (getattr(item, "text", None) or "").encode("utf-8")
+                text_chunks.append(text)
+                text_end += len(text)
+                text_offsets.append(text_end)
+
+                first_rows.append(len(row_items))
+                for prov in item.prov:
+                    box = prov.bbox
+                    row_items.append(item_id)
+                    row_pages.append(prov.page_no)
+                    row_bboxes.append((box.l, box.t, box.r, box.b) if box else (np.nan,) * 4)
+
+        self.kind = np.array(kinds, dtype=np.int8)
+        self.label = np.array(item_labels, dtype=np.int16)
+        self.number = np.array(item_numbers, dtype=np.int32)  # index within doc.texts/pictures/tables
+        self.first_row = np.array(first_rows, dtype=np.int64)
+        self._text = b"".join(text_chunks)
+        self._text_offsets = np.array(text_offsets, dtype=np.int64)
+
+        self.item = np.array(row_items, dtype=np.int32)
+        self.page = np.array(row_pages, dtype=np.int32)
+        self.bbox = np.array(row_bboxes, dtype=np.float64).reshape(-1, 4)
+        # Rows grouped by page (stable, so document order within a page) for per-page slicing
+        self._by_page = np.argsort(self.page, kind="stable")
+        self._sorted_pages = self.page[self._by_page]
+
+    def __len__(self):
+        return len(self.refs)
+
+    def text(self, item_id):
+        start, end = self._text_offsets[item_id], self._text_offsets[item_id + 1]
+        return self._text[start:end].decode("utf-8")
+
+    def texts(self, refs):
+        """ref -> text for refs; pictures, tables and unknown refs map to ""."""
+        ids = self.ids
+        return {ref: self.text(ids[ref]) if ref in ids else "" for ref in refs}
+
+    def page_rows(self, page_no):
+        """Row ids on a 1-based page, in document order."""
+        start, end = np.searchsorted(self._sorted_pages, (page_no, page_no + 1))
+        return self._by_page[start:end]
+
+    def positions(self, refs):
+        """Item id -> position of its ref in refs, -1 for items not in refs."""
+        positions = np.full(len(self.refs), -1, dtype=np.int64)
+        for position, ref in enumerate(refs):
+            item_id = self.ids.get(ref)
+            if item_id is not None and positions[item_id] < 0:
+                positions[item_id] = position
+        return positions
+
+    def ordered_page_rows(self, page_no, positions):
+        """Rows on a page whose item is in the reading order, sorted by that order."""
+        rows = self.page_rows(page_no)
+        rows = rows[positions[self.item[rows]] >= 0]
+        return rows[np.argsort(positions[self.item[rows]], kind="stable")]
+
+    def overlay_rects(self, page_no, page_height, zoom):
+        """
+        (x, y, w, h) page-image rectangles of the items whose first provenance is
+        on page_no, for each of their provenances on that page, in document order.
+        """
+        rows = self.page_rows(page_no)
+        rows = rows[self.page[self.first_row[self.item[rows]]] == page_no]
+        l, t, r, b = self.bbox[rows].T
+        rects = np.column_stack(((l * zoom), (page_height - t) * zoom, (r - l) * zoom, (t - b) * zoom))
+        return [tuple(rect) for rect in rects.tolist()]
@@ -1,25 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
-from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
+from fastapi import FastAPI, UploadFile, HTTPException, Body, Request
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse, Response, StreamingResponse
 from pathlib import Path
-import shutil
 import json
 import os
 import fitz  # PyMuPDF
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from PIL import Image
-import io
 import logging
+import threading
+import time
+import uuid
+import hashlib
+import base64
+import aiofiles
+try:
+    import orjson  # optional, faster JSON encoding for box payloads
+except ImportError:
+    orjson = None
+import multiprocessing
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from docling.datamodel.base_models import InputFormat
 from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.document_converter import DocumentConverter, PdfFormatOption, FormatOption
-from docling_core.types.doc import ImageRefMode
-from docling.backend.json.docling_json_backend import DoclingJSONBackend
-from docling.pipeline.simple_pipeline import SimplePipeline
+from docling.document_converter import DocumentConverter, PdfFormatOption
+from docling_core.types.doc import ImageRefMode, DoclingDocument
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from wiki_upload import upload_markdown_to_wikijs
+from wiki_upload import upload_markdown_to_wikijs, publish_markdown_file
+from sessions import DocumentSession, SessionStore
+from page_render import render_page, render_pages, write_tiles, tile_levels, write_atomically, IMAGE_SUFFIXES
+from render_cache import RenderCache
+from conversion_cache import ConversionCache
+from edit_log import EditLog, PatchError, apply_ops
+from spatial_index import PageSpatialIndex
+from reading_order import page_order
+from item_table import ItemTable, TEXT, PICTURE
 import pprint
+from PIL import Image
 
 
 app = FastAPI()
@@ -35,34 +52,85 @@ app.add_middleware(
 OUTPUT_DIR = Path("output")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-PDF_PATH = None  # Will be set dynamically after upload
-PAGE_IMAGES_DIR = OUTPUT_DIR / "page_images"
-ANNOTATED_IMAGES_DIR = OUTPUT_DIR / "annotated_images"
-BOXES_DIR = OUTPUT_DIR / "boxes"
-PAGE_IMAGES_DIR.mkdir(exist_ok=True)
-ANNOTATED_IMAGES_DIR.mkdir(exist_ok=True)
-BOXES_DIR.mkdir(exist_ok=True)
+# Each uploaded document gets its own directory: documents/<doc_id>/{page_images,annotated_images,boxes}
+DOCUMENTS_DIR = OUTPUT_DIR / "documents"
+DOCUMENTS_DIR.mkdir(exist_ok=True)
 
 _log = logging.getLogger(__name__)
 IMAGE_RESOLUTION_SCALE = 2.0
 
-# Global variables to store document processing results
-document = None
-group_dic = {}
-pic_tex = {}
-table_tex = {}
-diction = {}
-state = []
-refs = []
-positions = []
-height_dic = {}
-processed_refs = set()
-text_state = {}
-text_dic = {}
-LAST_UPLOADED_PDF_NAME = None
+# Uploads are processed in the background, one session per document
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="pdf-job")
+jobs = {}
+jobs_lock = threading.Lock()
+# Finished job records (uploads and publishes) are dropped this long after they finish
+JOB_TTL_MINUTES = int(os.environ.get("JOB_TTL_MINUTES", "60"))
 
-def load_docling_output(pdf_path: Path): #ok
-    pipeline_options = PdfPipelineOptions(
+# Bulk Wiki.js publishing: at most this many page uploads in flight across all publish jobs
+WIKI_PUBLISH_CONCURRENCY = int(os.environ.get("WIKI_PUBLISH_CONCURRENCY", "4"))
+publish_executor = ThreadPoolExecutor(max_workers=WIKI_PUBLISH_CONCURRENCY, thread_name_prefix="wiki-publish")
+
+# DocumentConverters keyed by (input format, pipeline options), built on demand and reused.
+# Each holds its own models, so only CONVERTER_POOL_SIZE conversions per key run at once;
+# with the default of 1, extra JOB_WORKERS overlap everything but the Docling conversion.
+CONVERTER_POOL_SIZE = int(os.environ.get("CONVERTER_POOL_SIZE", "1"))
+converter_pool = {}
+converter_pool_lock = threading.Lock()
+
+# Loaded DoclingDocuments beyond this budget are released and reloaded from disk on demand
+DOC_MEMORY_BUDGET_MB = int(os.environ.get("DOC_MEMORY_BUDGET_MB", "1024"))
+session_store = SessionStore(memory_budget=DOC_MEMORY_BUDGET_MB * 1024 * 1024)
+# Page processing runs on the columnar item table; with this set the DoclingDocument is
+# released once a document is ingested and only reloaded from disk for exports
+RELEASE_DOCUMENT_AFTER_INGEST = os.environ.get("RELEASE_DOCUMENT_AFTER_INGEST", "0") == "1"
+
+# Uploads are streamed to disk in chunks and hashed on the way; the SHA-256 is the document id
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "500"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+upload_lock = threading.Lock()
+
+# Converted documents, boxes and page images are cached by content hash + pipeline options
+CONVERSION_CACHE_MB = int(os.environ.get("CONVERSION_CACHE_MB", "10240"))
+# Entries of sessions used within this window are never evicted, so nobody loses a document mid-edit
+CACHE_PIN_MINUTES = int(os.environ.get("CACHE_PIN_MINUTES", "60"))
+# Batch ingestion workers turn eviction off, so they never delete entries this server is serving
+CONVERSION_CACHE_EVICT = os.environ.get("CONVERSION_CACHE_EVICT", "1") == "1"
+conversion_cache = ConversionCache(
+    OUTPUT_DIR / "conversion_cache", max_bytes=CONVERSION_CACHE_MB * 1024 * 1024 if CONVERSION_CACHE_EVICT else None
+)
+
+# Edit patches are appended to a per-document log; every EDIT_LOG_COMPACT_EVERY ops it is folded into a snapshot
+EDIT_LOG_COMPACT_EVERY = int(os.environ.get("EDIT_LOG_COMPACT_EVERY", "500"))
+
+# Page images are rendered on first request into a bounded disk cache and served from those files
+PAGE_IMAGE_DPI = 150
+EAGER_PAGE_RENDER = os.environ.get("EAGER_PAGE_RENDER", "0") == "1"
+RENDER_CACHE_DISK_MB = int(os.environ.get("RENDER_CACHE_DISK_MB", "4096"))
+render_cache = RenderCache(disk_budget=RENDER_CACHE_DISK_MB * 1024 * 1024)
+PAGE_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# png (lossless), webp or jpeg; previews are 1/PAGE_PREVIEW_FACTOR of full resolution; tiles are TILE_SIZE squares
+PAGE_IMAGE_FORMAT = os.environ.get("PAGE_IMAGE_FORMAT", "webp").lower()
+if PAGE_IMAGE_FORMAT not in IMAGE_SUFFIXES:
+    raise ValueError(f"PAGE_IMAGE_FORMAT must be one of {sorted(IMAGE_SUFFIXES)}")
+PAGE_IMAGE_QUALITY = int(os.environ.get("PAGE_IMAGE_QUALITY", "80"))
+PAGE_IMAGE_MEDIA_TYPE = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}[PAGE_IMAGE_FORMAT]
+PAGE_PREVIEW_FACTOR = int(os.environ.get("PAGE_PREVIEW_FACTOR", "3"))
+TILE_SIZE = int(os.environ.get("TILE_SIZE", "512"))
+render_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="page-prefetch")
+
+# Picture blocks reference /picture/{n} instead of inlining base64; thumbnails come in these sizes only
+PICTURE_THUMB_SIZES = (128, 256, 512)
+PICTURE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Eager rendering fans pages out over this many worker processes (1 renders in-process)
+PAGE_WORKERS = int(os.environ.get("PAGE_WORKERS", str(os.cpu_count() or 1)))
+page_pool = None
+page_pool_lock = threading.Lock()
+
+def pdf_pipeline_options():
+    return PdfPipelineOptions(
         layout_analysis=True,
         images_scale=IMAGE_RESOLUTION_SCALE,
         generate_page_images=True,
@@ -71,18 +139,151 @@ def load_docling_output(pdf_path: Path): #ok
         #ocr_options=RapidOcrOptions()
     )
 
-    converter = DocumentConverter(
+def _build_converter(input_format, pipeline_options=None):
+    return DocumentConverter(
+        allowed_formats=[input_format],
         format_options={
             InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
         }
     )
-    
-    result = converter.convert(pdf_path)
-    return result.document
 
-def process_document_structure(doc):
-    global group_dic, pic_tex, table_tex, diction, state, refs, positions, height_dic, processed_refs, text_state, text_dic
-    
+@contextmanager
+def checkout_converter(input_format=InputFormat.PDF, pipeline_options=None):
+    """
+    Lend a converter from the process-wide pool, keyed by input format and
+    pipeline options, as (converter, init_seconds, wait_seconds). Docling
+    pipelines are not safe to share between threads, so each converter is
+    lent to one caller at a time. A new one is built (init_seconds > 0) while
+    the key has fewer than CONVERTER_POOL_SIZE; otherwise the caller waits
+    for an idle one (wait_seconds).
+    """
+    options_key = pipeline_options.model_dump_json() if pipeline_options is not None else None
+    key = (input_format, options_key)
+    with converter_pool_lock:
+        pool = converter_pool.setdefault(key, {"idle": queue.LifoQueue(), "size": 0})
+        build = pool["idle"].empty() and pool["size"] < CONVERTER_POOL_SIZE
+        if build:
+            pool["size"] += 1
+    init_seconds = wait_seconds = 0.0
+    start = time.perf_counter()
+    if build:
+        try:
+            converter = _build_converter(input_format, pipeline_options)
+            converter.initialize_pipeline(input_format)
+        except Exception:
+            with converter_pool_lock:
+                pool["size"] -= 1
+            raise
+        init_seconds = time.perf_counter() - start
+        _log.info("Initialized %s converter %d of %d in %.2fs", input_format, pool["size"], CONVERTER_POOL_SIZE, init_seconds)
+    else:
+        converter = pool["idle"].get()
+        wait_seconds = time.perf_counter() - start
+    try:
+        yield converter, init_seconds, wait_seconds
+    finally:
+        pool["idle"].put(converter)
+
+@app.on_event("startup")
+def warm_converters():
+    with checkout_converter(InputFormat.PDF, pdf_pipeline_options()):
+        pass
+
+def load_docling_output(pdf_path: Path): #ok
+    """
+    Convert the PDF and return (document, timings) with converter init, the wait
+    for a converter busy with another job, and the conversion itself split out.
+    """
+    with checkout_converter(InputFormat.PDF, pdf_pipeline_options()) as (converter, init_seconds, wait_seconds):
+        start = time.perf_counter()
+        result = converter.convert(pdf_path)
+    timings = {
+        "init_s": round(init_seconds, 3),
+        "wait_s": round(wait_seconds, 3),
+        "convert_s": round(time.perf_counter() - start, 3),
+    }
+    return result.document, timings
+
+def attach_document(session, doc, size=None):
+    """Make doc the session's loaded document and account for it in the memory budget."""
+    if size is None:
+        size = session.document_json_path.stat().st_size if session.document_json_path.exists() else 0
+    with session.lock:
+        session.document = doc
+    session_store.mark_loaded(session, size)
+
+def get_session_document(session):
+    """Return the session's DoclingDocument, reloading it from disk if it was evicted."""
+    with session.lock:
+        doc = session.document
+        if doc is None:
+            if not session.document_json_path.exists():
+                raise HTTPException(status_code=400, detail="No document processed. Please upload a PDF first.")
+            doc = DoclingDocument.load_from_json(session.document_json_path)
+            attach_document(session, doc)
+        else:
+            session_store.touch(session)
+    return doc
+
+def live_session(doc_id):
+    """The session for doc_id, or None if there is none or its conversion cache entry was evicted."""
+    session = session_store.get(doc_id)
+    if session is not None and not session.artifacts_dir.exists():
+        # Its conversion cache entry was evicted; a re-upload converts it again
+        session_store.remove(doc_id)
+        session = None
+    return session
+
+def require_session(doc_id):
+    session = live_session(doc_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown document id: {doc_id}. Please upload the PDF again.")
+    session.last_used = time.time()
+    return session
+
+def options_fingerprint():
+    """Short hash of everything besides the PDF bytes that shapes the cached conversion artifacts."""
+    options = f"{pdf_pipeline_options().model_dump_json()}|dpi={PAGE_IMAGE_DPI}"
+    return hashlib.sha256(options.encode("utf-8")).hexdigest()[:16]
+
+def session_structure(session):
+    """The Docling-derived session state that the conversion cache stores next to the document."""
+    return {
+        "pages_count": session.pages_count,
+        "page_rects": session.page_rects,
+        "page_heights": session.page_heights,
+        "group_dic": session.group_dic,
+        "pic_tex": session.pic_tex,
+        "table_tex": session.table_tex,
+        "refs": session.refs,
+        "text_dic": session.text_dic,
+    }
+
+def restore_session_structure(session, structure):
+    with session.lock:
+        session.page_rects = {int(page_no): [tuple(r) for r in rects] for page_no, rects in structure["page_rects"].items()}
+        session.page_heights = {int(page_no): h for page_no, h in structure.get("page_heights", {}).items()}
+        session.group_dic = structure["group_dic"]
+        session.pic_tex = structure["pic_tex"]
+        session.table_tex = structure["table_tex"]
+        session.nested_refs = collect_nested_refs(session.group_dic, session.pic_tex, session.table_tex)
+        session.refs = structure["refs"]
+        session.text_dic = structure["text_dic"]
+        session.pages_count = structure["pages_count"]
+
+def pinned_cache_entries():
+    """Cache entries that must survive eviction: documents being processed, held in memory or recently used."""
+    recent = time.time() - CACHE_PIN_MINUTES * 60
+    return {
+        s.artifacts_dir for s in session_store.sessions()
+        if s.document is not None or s.pages_count is None or s.last_used >= recent
+    }
+
+def process_document_structure(session, doc, items):
+    group_dic = {}
+    pic_tex = {}
+    table_tex = {}
+
     # Build group, picture, and table dictionaries
     for i in doc.groups:
         group_dic[i.self_ref] = [j.cref for j in i.children]
@@ -132,397 +333,977 @@ def process_document_structure(doc):
     for key, value in diction.items():
         print(f"{key} → {value}")
         
-    state = list(diction.keys())
-    refs = state.copy()  # Initialize refs with the same order as state
-    positions = list(range(len(refs)))
+    refs = list(diction.keys())
 
-    # Build height dictionary and text state
-    height_dic = {}
-    processed_refs = set()
-    text_state = {}
+    # Initialize text_dic with current text content, read from the item table's text column
+    text_dic = items.texts(refs)
 
-    for tex in doc.texts:
-        if "pictures" in tex.self_ref or "tables" in tex.self_ref:
-            continue
-        ref = tex.self_ref
-        if ref in processed_refs:
-            continue
-        processed_refs.add(ref)
-        if ref not in height_dic:
-            height_dic[ref] = round(abs(tex.prov[0].bbox.t - tex.prov[0].bbox.b), 2)
-        text_state[ref] = tex.text
-
-    # Initialize text_dic with current text content
-    text_dic = {ref: text_state.get(ref, "") for ref in refs}
-
-def draw_page_boxes(pdf_path, page_refs, page_no, dpi=150): #ok
-    doc = fitz.open(pdf_path)
-    page = doc[page_no]
-    pix = page.get_pixmap(dpi=dpi)
-    width, height = pix.width, pix.height
-    img_bytes = pix.tobytes("ppm")
-    image = Image.open(io.BytesIO(img_bytes))
-    zoom = dpi / 72
-    fig, ax = plt.subplots(figsize=(12, 10))
-    ax.imshow(image, extent=[0, width, height, 0])
-
-    def draw_items_with_position(items, item_type="text"):
-        for ref in page_refs:
-            item = next((t for t in items if t.self_ref == ref), None)
-            if item:
-                for prov in item.prov:
-                    if prov.page_no == page_no + 1:
-                        box = prov.bbox
-                        x = box.l * zoom
-                        y = (page.rect.height - box.t) * zoom
-                        w = (box.r - box.l) * zoom
-                        h = (box.t - box.b) * zoom
-                        rect = patches.Rectangle((x, y), w, h, linewidth=1,
-                                                 edgecolor="#000000", facecolor='#A2CFFE', alpha=0.3)
-                        ax.add_patch(rect)
-                        try:
-                            pos = refs.index(ref)  # Use global refs for position
-                            # ax.text(x, y - 5, str(pos), fontsize=8, color='red', ha='left', va='bottom')
-                        except ValueError:
-                            pass
-    
-    if document:
-        draw_items_with_position(document.texts, "text")
-        draw_items_with_position(document.pictures, "picture")
-        draw_items_with_position(document.tables, "table")
-
-    ax.set_xlim(0, width)
-    ax.set_ylim(height, 0)
-    ax.axis('off')
-    plt.tight_layout()
-    
-    annotated_path = ANNOTATED_IMAGES_DIR / f"annotated_page_{page_no}.png"
-    plt.savefig(annotated_path, dpi=dpi, bbox_inches='tight', pad_inches=0)
-    plt.clf()
-    plt.close('all')
-
-def pdf_to_json(pdf_path: Path, document): #ok
-    json_dic = document.export_to_dict()
-    json_out_path = OUTPUT_DIR / f"{pdf_path.stem}.json"
-    with open(json_out_path, "w", encoding="utf-8") as f:
-        json.dump(json_dic, f, indent=2, ensure_ascii=False)
-    return json_out_path
-
-def json_loader(output_path):
-    json_format_option = FormatOption(
-        pipeline_cls=SimplePipeline,
-        backend=DoclingJSONBackend
-    )
-    converter = DocumentConverter(
-        allowed_formats=[InputFormat.JSON_DOCLING],
-        format_options={
-            InputFormat.JSON_DOCLING: json_format_option
-        }
-    )
-    converter.initialize_pipeline(InputFormat.JSON_DOCLING)
-    result1 = converter.convert(output_path)
-    doc = result1.document
-    doc_filename = f"jso2_{output_path.stem}"
-    out_path = OUTPUT_DIR / f"{doc_filename}-with-image-dummy-refs.md"
-    doc.save_as_markdown(out_path, image_mode=ImageRefMode.EMBEDDED)
-    return out_path
-
-def read_markdown_file(file_path):
-    with open(file_path, "r", encoding="utf-8") as file:
-        return file.read()
-
-def generate_and_modify_json(source_pdf_path: Path, doc):
-    global refs, text_dic, group_dic, pic_tex, table_tex
-    
-    # Create a copy of refs to work with
-    final_refs = refs.copy()
-    
-    # Remove group children, picture captions, and table captions from refs
-    # following the same logic as the working sample
-    group_lis = []
-    for i in group_dic.values():
-        for j in i:
-            group_lis.append(j)
-    
-    for i in group_lis:
-        if i in final_refs:
-            final_refs.remove(i)
-    
-    pic_text_lis = []
-    for i in pic_tex.values():
-        for j in i:
-            pic_text_lis.append(j)
-    
-    for i in pic_text_lis:
-        if i in final_refs:
-            final_refs.remove(i)
-    
-    table_text_lis = []
-    for i in table_tex.values():
-        for j in i:
-            table_text_lis.append(j)
-    
-    for i in table_text_lis:
-        if i in final_refs:
-            final_refs.remove(i)
-    
-    # Create children array with the cleaned refs
-    children = [{"$ref": r} for r in final_refs]
+    with session.lock:
+        session.group_dic = group_dic
+        session.pic_tex = pic_tex
+        session.table_tex = table_tex
+        session.nested_refs = collect_nested_refs(group_dic, pic_tex, table_tex)
+        session.refs = refs
+        session.text_dic = text_dic
+
+def collect_nested_refs(group_dic, pic_tex, table_tex):
+    """Group children, picture captions and table captions: refs exported through their parent."""
+    nested = set()
+    for children in (*group_dic.values(), *pic_tex.values(), *table_tex.values()):
+        nested.update(children)
+    return frozenset(nested)
+
+def build_body_children(session):
+    """body.children for export: the session's reading order minus nested refs, in one pass."""
+    nested = session.nested_refs
+    return [{"$ref": r} for r in session.refs if r not in nested]
+
+def generate_and_modify_json(session, doc):
+    """
+    Build the export dict for doc with the session's reading order and text
+    edits applied, entirely in memory. The document's own export_to_dict() is
+    computed once and cached on the session; edits are layered on shallow
+    copies, so only body.children and edited texts are new objects.
+    """
+    text_dic = session.text_dic
+    children = build_body_children(session)
     
-    # Generate JSON from document
-    output_path_json = pdf_to_json(source_pdf_path, doc)
+    base = session.export_base
+    if base is None:
+        base = session.export_base = doc.export_to_dict()
 
-    # Load and modify the JSON
-    with open(output_path_json, "r", encoding="utf-8") as f:
-        x = json.load(f)
+    x = dict(base)
 
     # Update body children with new order
-    x["body"]["children"] = children
+    x["body"] = {**base["body"], "children": children}
     
     # Update text content with edited texts
-    for i in x.get("texts", []):
-        if i.get("self_ref") in text_dic:
-            i["text"] = text_dic[i["self_ref"]]
-
-    # Save the modified JSON
-    with open(output_path_json, "w", encoding="utf-8") as f:
-        json.dump(x, f, indent=4)
+    x["texts"] = [
+        {**i, "text": text_dic[i["self_ref"]]} if i.get("self_ref") in text_dic else i
+        for i in base.get("texts", [])
+    ]
         
-    return output_path_json
+    return x
+
+def export_markdown_text(export_dict, image_mode=ImageRefMode.EMBEDDED):
+    """Render markdown straight from an export dict, without a converter or temporary files."""
+    doc = DoclingDocument.model_validate(export_dict)
+    return doc.export_to_markdown(image_mode=image_mode)
 
-def process_pdf(pdf_path: Path):
-    global document
+def with_external_images(export_dict, assets_dir: Path):
+    """
+    Copy of export_dict whose embedded picture images are replaced by files in
+    assets_dir, referenced as assets/<hash>.<ext>. Files are named by content,
+    so a picture repeated across the document is stored once and existing
+    files are not decoded or written again.
+    """
+    assets_dir.mkdir(parents=True, exist_ok=True)
+    pictures = []
+    for picture in export_dict.get("pictures", []):
+        uri = str((picture.get("image") or {}).get("uri") or "")
+        if not uri.startswith("data:image"):
+            pictures.append(picture)
+            continue
+        header, _, payload = uri.partition(",")
+        suffix = header[len("data:image/"):].split(";")[0] or "png"
+        name = f"{hashlib.sha256(payload.encode('ascii')).hexdigest()[:16]}.{suffix}"
+        asset_path = assets_dir / name
+        if not asset_path.exists():
+            asset_path.write_bytes(base64.b64decode(payload))
+        pictures.append({**picture, "image": {**picture["image"], "uri": f"{assets_dir.name}/{name}"}})
+    return {**export_dict, "pictures": pictures}
+
+def markdown_assets_paths(session):
+    """
+    The markdown export with external images and its assets/ directory, under
+    <output_dir>/markdown. The file name matches the embedded export, so both
+    publish to the same Wiki.js page.
+    """
+    export_dir = session.output_dir / "markdown"
+    return export_dir / f"{session.name}_complete_edited.md", export_dir / "assets"
+
+def save_markdown_with_assets(session):
+    """Write the markdown export with external image assets, regenerating it only when the edit revision moved."""
+    markdown_path, assets_dir = markdown_assets_paths(session)
+    with session.lock:
+        if session.exported_assets_revision == session.revision and markdown_path.exists():
+            return markdown_path
+        export_dict = with_external_images(generate_and_modify_json(session, get_session_document(session)), assets_dir)
+        tmp_path = markdown_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(export_markdown_text(export_dict, ImageRefMode.REFERENCED))
+        os.replace(tmp_path, markdown_path)
+        session.exported_assets_revision = session.revision
+    return markdown_path
+
+def iter_file(path: Path, chunk_size=UPLOAD_CHUNK_SIZE):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+def prune_jobs():
+    """Drop records of jobs that finished more than JOB_TTL_MINUTES ago. Call with jobs_lock held."""
+    expired_before = time.time() - JOB_TTL_MINUTES * 60
+    expired = [job_id for job_id, job in jobs.items() if job["finished_at"] and job["finished_at"] < expired_before]
+    for job_id in expired:
+        del jobs[job_id]
+
+def create_job(progress=None, **fields):
+    job_id = uuid.uuid4().hex
+    with jobs_lock:
+        prune_jobs()
+        jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": "queued",
+            "progress": progress if progress is not None else {
+                "converted": False,
+                "pages_rendered": 0,
+                "pages_total": None,
+                "boxes_written": 0,
+            },
+            "timings": {},
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+            **fields,
+        }
+    return job_id
+
+def update_job(job_id, **fields):
+    """Update top-level job fields; unknown keys are treated as progress counters."""
+    if job_id is None:
+        return
+    with jobs_lock:
+        job = jobs[job_id]
+        for key, value in fields.items():
+            if key in job["progress"]:
+                job["progress"][key] = value
+            else:
+                job[key] = value
+
+def get_job(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return None
+        job = {**job, "progress": dict(job["progress"])}
+        if "pages" in job:
+            job["pages"] = {key: dict(page) for key, page in job["pages"].items()}
+        return job
+
+def process_pdf(session, job_id=None):
+    pdf_path = session.pdf_path
     
-    document = load_docling_output(pdf_path)
-    process_document_structure(document)
+    update_job(job_id, status="running", stage="converting")
+    document, timings = load_docling_output(pdf_path)
+    update_job(job_id, timings=timings)
+    _log.info(
+        "Docling init %ss, wait %ss, conversion %ss: %s",
+        timings["init_s"], timings["wait_s"], timings["convert_s"], pdf_path.name,
+    )
+    document.save_as_json(session.document_json_path, image_mode=ImageRefMode.EMBEDDED)
+    attach_document(session, document)
+    # Only needed while the pages are processed, so it is not kept on the session
+    items = ItemTable(document)
+    process_document_structure(session, document, items)
     
-    pdf = fitz.open(str(pdf_path))
-    for page_no in range(len(pdf)):
-        page = pdf[page_no]
-        pix = page.get_pixmap(dpi=150)
-        img_path = PAGE_IMAGES_DIR / f"page_{page_no}.png"
-        pix.save(str(img_path))
-
-        page_refs = [
-            item.self_ref
-            for item in document.texts + document.pictures + document.tables
-            if item.prov and item.prov[0].page_no == page_no + 1
-        ]
-        
-        draw_page_boxes(pdf_path, page_refs, page_no, 150)
-
-        page_blocks = []
-
-        for ref in refs:  # Use the correct order from diction or refs
-            # Find the item in texts, pictures, or tables
-            item = next(
-                (x for x in (document.texts + document.pictures + document.tables) if x.self_ref == ref),
-                None
-            )
-            if item:
-                print(item.self_ref)
-                for prov in item.prov:
-                    if prov.page_no == page_no + 1 and prov.bbox:
-                        if hasattr(item, 'text') and (not item.text or not item.text.strip()):
-                            continue
-                        
-                        block = {
-                            "self_ref": item.self_ref,
-                            "page": prov.page_no,
-                            "bbox": {
-                                "left": prov.bbox.l, "top": prov.bbox.t,
-                                "right": prov.bbox.r, "bottom": prov.bbox.b
-                            },
-                            "type": getattr(item, "label", None)
-                        }
-                        if hasattr(item, 'text'):
-                            block["content"] = item.text.strip()
-                        elif hasattr(item, 'image'):
-                            image_data = None
-                            if hasattr(item.image, 'uri') and str(item.image.uri).startswith('data:image'):
-                                image_data = str(item.image.uri)
-                            block["content"] = image_data or ""
-                        elif hasattr(item, 'to_markdown'):
-                            block["content"] = item.to_markdown()
-                        
-                        page_blocks.append(block)
+    # Position of every item in the reading order, so each page only sorts its own rows
+    positions = items.positions(session.refs)
+
+    # Overlay geometry for every page up front; the page images themselves are
+    # rendered lazily by get_rendered_page
+    zoom = PAGE_IMAGE_DPI / 72
+    with fitz.open(str(pdf_path)) as pdf:
+        pages_count = len(pdf)
+        page_rects = {}
+        page_heights = {}
+        for page_no in range(pages_count):
+            page_heights[page_no] = pdf[page_no].rect.height
+            page_rects[page_no] = items.overlay_rects(page_no + 1, page_heights[page_no], zoom)
+    session.page_rects = page_rects
+    session.page_heights = page_heights
+
+    update_job(job_id, stage="boxes", converted=True, pages_total=pages_count)
+    # Written up front so the frontend can show the first pages while later ones are processed
+    session.pages_count = pages_count
+    with open(session.output_dir / "pages_count.txt", "w") as f:
+        f.write(str(pages_count))
+
+    page_tasks = []
+    for page_no in range(pages_count):
+        page_rows = []
+
+        # Rows on this page in reading order
+        for row in items.ordered_page_rows(page_no + 1, positions).tolist():
+            item_id = items.item[row]
+            left, top, right, bottom = items.bbox[row].tolist()
+            if left != left:  # NaN: provenance without a bbox
+                continue
+            kind = items.kind[item_id]
+            if kind == TEXT:
+                content = items.text(item_id).strip()
+                if not content:
+                    continue
+            elif kind == PICTURE:
+                content = save_picture(session, document.pictures[items.number[item_id]]) or ""
+            else:
+                content = ""  # tables carry no inline content; only pictures have a /picture URL
+            
+            page_rows.append((
+                items.refs[item_id], int(items.page[row]),
+                left, top, right, bottom,
+                items.labels[items.label[item_id]], content,
+            ))
         
-        with open(BOXES_DIR / f"boxes_{page_no}.json", "w", encoding="utf-8") as f:
-            json.dump(page_blocks, f, indent=2)
+        set_page_boxes(session, page_no, page_rows)
+        update_job(job_id, boxes_written=page_no + 1)
+        if EAGER_PAGE_RENDER:
+            page_tasks.append(page_task(session, page_no))
 
-    with open(OUTPUT_DIR / "pages_count.txt", "w") as f:
-        f.write(str(len(pdf)))
+    if page_tasks:
+        update_job(job_id, stage="rendering")
+        for page_no, _ in render_pages(page_tasks, get_page_pool()):
+            render_cache.register([*page_image_paths(session, page_no), *page_image_paths(session, page_no, "preview")])
+            update_job(job_id, pages_rendered=page_no + 1)
 
-def save_complete_edited_json_and_markdown():
-    """Save complete edited JSON including all groups, text, tables and generate markdown"""
-    global document, refs, text_dic, group_dic, pic_tex, table_tex
+    if RELEASE_DOCUMENT_AFTER_INGEST:
+        session_store.release(session)
+    conversion_cache.save_structure(session.artifacts_dir, session_structure(session), pinned=pinned_cache_entries())
+    recover_edits(session)
+    update_job(job_id, status="done", stage="done", finished_at=time.time())
+
+def save_picture(session, item):
+    """
+    Decode a picture's embedded data URI into session.pictures_dir once and
+    return the /picture URL that box payloads carry instead of the base64.
+    The URL includes a hash of the image, so clients can cache it forever.
+    """
+    uri = str(getattr(item.image, "uri", "") or "")
+    if not item.self_ref.startswith("#/pictures/") or not uri.startswith("data:image"):
+        return None
+    header, _, payload = uri.partition(",")
+    data = base64.b64decode(payload)
+    picture_no = int(item.self_ref.rsplit("/", 1)[-1])
+    suffix = header[len("data:image/"):].split(";")[0] or "png"
+    path = session.pictures_dir / f"{picture_no}.{suffix}"
+    if not path.exists():
+        write_atomically(path, lambda tmp_path: tmp_path.write_bytes(data))
+    version = hashlib.sha256(data).hexdigest()[:12]
+    return f"/picture/{picture_no}?doc_id={session.doc_id}&v={version}"
+
+def picture_path(session, picture_no, size=None):
+    """Path of a stored picture, or of its thumbnail (made on first request) when size is given."""
+    matches = list(session.pictures_dir.glob(f"{picture_no}.*"))
+    if not matches:
+        raise HTTPException(status_code=404, detail="Picture not found.")
+    original = matches[0]
+    if size is None:
+        return original
+    if size not in PICTURE_THUMB_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(PICTURE_THUMB_SIZES)}")
+    thumb = session.pictures_dir / "thumbs" / f"{picture_no}_{size}{original.suffix}"
+    if not thumb.exists():
+        thumb.parent.mkdir(exist_ok=True)
+        with Image.open(original) as image:
+            image.thumbnail((size, size))
+            tmp = thumb.with_name(f"{thumb.stem}.{uuid.uuid4().hex[:8]}{thumb.suffix}")
+            image.save(tmp)
+        os.replace(tmp, thumb)
+    return thumb
+
+def blocks_from_rows(rows):
+    """Expand compact box rows into the block dicts the frontend expects."""
+    blocks = []
+    for self_ref, page, left, top, right, bottom, label, content in rows:
+        block = {
+            "self_ref": self_ref,
+            "page": page,
+            "bbox": {"left": left, "top": top, "right": right, "bottom": bottom},
+            "type": label,
+        }
+        if content is not None:
+            block["content"] = content
+        blocks.append(block)
+    return blocks
+
+def encode_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def set_page_boxes(session, page_no, rows):
+    """
+    Hold a page's boxes, as converted, in the session as compact rows plus
+    their serialized bytes, which /bounding_boxes serves directly until the
+    first edit. boxes_N.json on disk is a snapshot for the conversion cache,
+    written from the same bytes.
+    """
+    data = encode_json(blocks_from_rows(rows))
+    with session.lock:
+        session.page_boxes[page_no] = rows
+        session.page_box_bytes[page_no] = (session.revision, data)
+        session.page_indexes.pop(page_no, None)
+    (session.boxes_dir / f"boxes_{page_no}.json").write_bytes(data)
+
+def box_snapshot_path(session, page_no):
+    box_path = session.boxes_dir / f"boxes_{page_no}.json"
+    if not box_path.exists():
+        raise HTTPException(status_code=404, detail="Bounding boxes not found.")
+    return box_path
+
+def page_box_rows(session, page_no):
+    """A page's box rows as converted, from memory or, for sessions restored from the conversion cache, its snapshot."""
+    rows = session.page_boxes.get(page_no)
+    if rows is None:
+        with open(box_snapshot_path(session, page_no), "rb") as f:
+            blocks = json.load(f)
+        rows = session.page_boxes[page_no] = [
+            (b["self_ref"], b["page"], b["bbox"]["left"], b["bbox"]["top"], b["bbox"]["right"], b["bbox"]["bottom"],
+             b.get("type"), b.get("content"))
+            for b in blocks
+        ]
+    return rows
+
+def ref_positions(session):
+    """Position of every ref in the session's reading order, rebuilt when the revision moves."""
+    cached = session.ref_positions
+    if cached is None or cached[0] != session.revision:
+        positions = {}
+        for i, ref in enumerate(session.refs):
+            positions.setdefault(ref, i)
+        cached = session.ref_positions = (session.revision, positions)
+    return cached[1]
+
+def edited_page_rows(session, page_no):
+    """
+    A page's box rows as the editor should see them: sorted by the session's
+    reading order (refs not in it last) and with saved text edits applied, so
+    recovered and auto-ordered edits show up after a restart.
+    """
+    with session.lock:
+        rows = page_box_rows(session, page_no)
+        if session.revision == 0:
+            return rows
+        positions = ref_positions(session)
+        text_dic = session.text_dic
+        rows = sorted(rows, key=lambda row: positions.get(row[0], len(positions)))
+        return [
+            (*row[:7], text_dic[row[0]].strip()) if row[0].startswith("#/texts/") and row[0] in text_dic else row
+            for row in rows
+        ]
+
+def get_page_box_bytes(session, page_no):
+    cached = session.page_box_bytes.get(page_no)
+    if cached is not None and cached[0] == session.revision:
+        return cached[1]
+    with session.lock:
+        revision = session.revision
+        if revision == 0:
+            # Unedited sessions restored from the conversion cache serve the snapshot without parsing it
+            data = box_snapshot_path(session, page_no).read_bytes()
+        else:
+            data = encode_json(blocks_from_rows(edited_page_rows(session, page_no)))
+        session.page_box_bytes[page_no] = (revision, data)
+    return data
+
+def get_page_height(session, page_no):
+    page_height = session.page_heights.get(page_no)
+    if page_height is None:
+        with fitz.open(str(session.pdf_path)) as pdf:
+            page_height = pdf[page_no].rect.height
+        session.page_heights[page_no] = page_height
+    return page_height
+
+def row_pixel_bounds(row, page_height):
+    """(x0, y0, x1, y1) of a box row in page-image pixels; the same transform as ItemTable.overlay_rects."""
+    _, _, left, top, right, bottom, *_ = row
+    zoom = PAGE_IMAGE_DPI / 72
+    return left * zoom, (page_height - top) * zoom, right * zoom, (page_height - bottom) * zoom
+
+def get_page_index(session, page_no):
+    """The page's spatial index over its boxes, built on first use."""
+    page_index = session.page_indexes.get(page_no)
+    if page_index is not None:
+        return page_index
+    rows = page_box_rows(session, page_no)
+    page_height = get_page_height(session, page_no)
+    page_index = PageSpatialIndex((row[0], row_pixel_bounds(row, page_height)) for row in rows)
+    session.page_indexes[page_no] = page_index
+    return page_index
+
+def spatial_results(results):
+    return [{"self_ref": ref, "rect": list(rect)} for ref, rect in results]
+
+def page_image_paths(session, page_no, tier="full"):
+    """(page, annotated) image paths of a page at the full or preview tier."""
+    suffix = IMAGE_SUFFIXES[PAGE_IMAGE_FORMAT]
+    if tier == "preview":
+        return (
+            session.previews_dir / f"page_{page_no}{suffix}",
+            session.previews_dir / f"annotated_page_{page_no}{suffix}",
+        )
+    return (
+        session.page_images_dir / f"page_{page_no}{suffix}",
+        session.annotated_images_dir / f"annotated_page_{page_no}{suffix}",
+    )
+
+def render_session_page(session, page_no, annotated=False):
+    """
+    Rasterize a page once into whichever of its images are missing. Sessions
+    whose clients draw overlays themselves only get annotated images when
+    one is asked for.
+    """
+    page_path, annotated_path = page_image_paths(session, page_no)
+    preview_path, annotated_preview_path = page_image_paths(session, page_no, "preview")
+    if session.client_overlay and not annotated:
+        annotated_path = annotated_preview_path = None
+    page_path, annotated_path, preview_path, annotated_preview_path = (
+        path if path is not None and not path.exists() else None
+        for path in (page_path, annotated_path, preview_path, annotated_preview_path)
+    )
+    # One rasterization per page: the annotated image and both previews come from the same pixels
+    with fitz.open(str(session.pdf_path)) as pdf:
+        render_page(
+            pdf[page_no], PAGE_IMAGE_DPI, session.page_rects.get(page_no, []), page_path, annotated_path,
+            image_format=PAGE_IMAGE_FORMAT, quality=PAGE_IMAGE_QUALITY,
+            preview_paths=(preview_path, annotated_preview_path), preview_factor=PAGE_PREVIEW_FACTOR,
+        )
+    return [path for path in (page_path, annotated_path, preview_path, annotated_preview_path) if path is not None]
+
+def page_task(session, page_no):
+    """Describe one page for page_render.render_page_task with plain, picklable values."""
+    page_path, annotated_path = page_image_paths(session, page_no)
+    preview_paths = [str(p) for p in page_image_paths(session, page_no, "preview")]
+    if session.client_overlay:
+        annotated_path, preview_paths = None, [preview_paths[0], None]
+    return {
+        "pdf_path": str(session.pdf_path),
+        "page_no": page_no,
+        "dpi": PAGE_IMAGE_DPI,
+        "rects": session.page_rects.get(page_no, []),
+        "page_image_path": str(page_path),
+        "annotated_image_path": str(annotated_path) if annotated_path is not None else None,
+        "image_format": PAGE_IMAGE_FORMAT,
+        "quality": PAGE_IMAGE_QUALITY,
+        "preview_paths": preview_paths,
+        "preview_factor": PAGE_PREVIEW_FACTOR,
+    }
+
+def get_page_pool():
+    """Process pool shared by eager page rendering, or None when PAGE_WORKERS is 1."""
+    global page_pool
+    if PAGE_WORKERS <= 1:
+        return None
+    with page_pool_lock:
+        if page_pool is None:
+            # spawn, not fork: this process runs threads (jobs, prefetch) that fork would copy mid-flight
+            page_pool = ProcessPoolExecutor(max_workers=PAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return page_pool
+
+def ensure_page_rendered(session, page_no):
+    page_path, _ = page_image_paths(session, page_no)
+    render_cache.ensure(page_path, (session.doc_id, page_no), lambda: render_session_page(session, page_no))
+
+def get_rendered_page(session, page_no, annotated=False, tier="full"):
+    """Return the image path for a page, rendering on first request and prefetching its neighbours."""
+    if session.pages_count is None or not 0 <= page_no < session.pages_count:
+        raise HTTPException(status_code=404, detail="Page image not found.")
+    page_path, annotated_path = page_image_paths(session, page_no, tier)
+    path = annotated_path if annotated else page_path
+    render_cache.ensure(path, (session.doc_id, page_no), lambda: render_session_page(session, page_no, annotated))
+    for neighbour in (page_no + 1, page_no - 1):
+        if 0 <= neighbour < session.pages_count and not page_image_paths(session, neighbour)[0].exists():
+            render_executor.submit(ensure_page_rendered, session, neighbour)
+    return path
+
+def page_image_version(session):
+    """
+    Version tag for a session's page image URLs. Page images are a pure function
+    of the conversion they come from (PDF hash, pipeline options and dpi for
+    uploads, which is what the artifacts directory is named by) and the image
+    encoding, so URLs carrying this tag can be cached by browsers forever.
+    """
+    key = f"{session.artifacts_dir.name}|{PAGE_IMAGE_FORMAT}|{PAGE_IMAGE_QUALITY}|{PAGE_PREVIEW_FACTOR}|{TILE_SIZE}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+def image_file_response(session, request: Request, v, etag_key, get_path):
+    version = page_image_version(session)
+    etag = f'"{version}-{etag_key}"'
+    # Unversioned URLs still revalidate; versioned ones never change
+    headers = {"ETag": etag, "Cache-Control": PAGE_IMAGE_CACHE_CONTROL if v == version else "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse streams the file (with Range support) instead of holding the image in memory
+    return FileResponse(get_path(), media_type=PAGE_IMAGE_MEDIA_TYPE, headers=headers)
+
+def page_image_response(session, page_no, request: Request, v, annotated, tier="full"):
+    if tier not in ("full", "preview"):
+        raise HTTPException(status_code=400, detail="tier must be full or preview")
+    etag_key = f"{page_no}-{'annotated' if annotated else 'page'}-{tier}"
+    return image_file_response(session, request, v, etag_key, lambda: get_rendered_page(session, page_no, annotated, tier))
+
+def page_tile_dir(session, page_no, annotated):
+    return session.tiles_dir / f"{'annotated_' if annotated else ''}page_{page_no}"
+
+def page_tile_levels(session, page_no, annotated):
+    """Pyramid geometry for a page: [{level, width, height, cols, rows}], level 0 at full resolution."""
+    with Image.open(get_rendered_page(session, page_no, annotated)) as image:
+        width, height = image.size
+    levels = []
+    for level in range(tile_levels(width, height, TILE_SIZE)):
+        # Image.reduce, which write_tiles cuts each level from, rounds sizes up
+        level_width, level_height = -(-width // 2 ** level), -(-height // 2 ** level)
+        levels.append({
+            "level": level, "width": level_width, "height": level_height,
+            "cols": -(-level_width // TILE_SIZE), "rows": -(-level_height // TILE_SIZE),
+        })
+    return levels
+
+def get_page_tile(session, page_no, level, col, row, annotated):
+    """Path of one tile, cutting its whole pyramid level on first request."""
+    if level >= len(page_tile_levels(session, page_no, annotated)):
+        raise HTTPException(status_code=404, detail="Tile not found.")
+    image_path = get_rendered_page(session, page_no, annotated)
+    tile_dir = page_tile_dir(session, page_no, annotated)
+    tile_path = tile_dir / f"{level}_{col}_{row}{IMAGE_SUFFIXES[PAGE_IMAGE_FORMAT]}"
+    render_cache.ensure(
+        tile_path,
+        (session.doc_id, page_no, annotated, level),
+        lambda: write_tiles(image_path, tile_dir, level, TILE_SIZE, PAGE_IMAGE_FORMAT, PAGE_IMAGE_QUALITY),
+    )
+    if not tile_path.exists():
+        raise HTTPException(status_code=404, detail="Tile not found.")
+    return tile_path
+
+def run_pdf_job(job_id, session):
+    try:
+        process_pdf(session, job_id)
+    except Exception as e:
+        _log.exception("Docling extraction failed")
+        update_job(job_id, status="failed", error=f"Docling extraction failed: {e}", finished_at=time.time())
+
+def export_artifact_paths(session):
+    return (
+        session.output_dir / f"{session.name}_complete_edited.json",
+        session.output_dir / f"{session.name}_complete_edited.md",
+    )
+
+def export_etag(session, kind, revision=None):
+    """ETag of an export artifact: changes with every edit revision and every new session."""
+    revision = session.revision if revision is None else revision
+    return f'"{session.doc_id[:16]}-{session.epoch}-{revision}-{kind}"'
+
+def etag_matches(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+def save_complete_edited_json_and_markdown(session):
+    """
+    Save complete edited JSON including all groups, text, tables and generate markdown.
+    Artifacts are regenerated only when the edit revision changed since the last export.
+    """
+    complete_json_path, markdown_file_path = export_artifact_paths(session)
     
-    if not document:
-        raise HTTPException(status_code=400, detail="No document processed. Please upload a PDF first.")
+    with session.lock:
+        revision = session.revision
+        up_to_date = (
+            session.exported_revision == revision
+            and complete_json_path.exists() and markdown_file_path.exists()
+        )
+        if not up_to_date:
+            document = get_session_document(session)
+            try:
+                # Step 1: Apply reading order and text edits to the document in memory
+                x = generate_and_modify_json(session, document)
+                
+                # Step 2: Save the complete modified JSON. Both files are written next to
+                # their target and swapped in, so downloads still streaming the previous
+                # revision keep reading intact files
+                json_tmp_path = complete_json_path.with_suffix(".json.tmp")
+                with open(json_tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(x, f, indent=2, ensure_ascii=False)
+                
+                # Step 3: Render markdown from the same dict and save it
+                markdown_tmp_path = markdown_file_path.with_suffix(".md.tmp")
+                with open(markdown_tmp_path, "w", encoding="utf-8") as f:
+                    f.write(export_markdown_text(x))
+                os.replace(json_tmp_path, complete_json_path)
+                os.replace(markdown_tmp_path, markdown_file_path)
+                session.exported_revision = revision
+                
+            except Exception as e:
+                _log.exception("Error saving complete edited JSON and markdown")
+                raise HTTPException(status_code=500, detail=f"Error saving complete edited JSON and markdown: {e}")
     
+    return {
+        "json_path": str(complete_json_path),
+        "markdown_path": str(markdown_file_path),
+        "revision": revision,
+        "message": "Complete edited JSON and markdown saved successfully"
+    }
+
+def create_session(pdf_filename, doc_id=None, artifacts_dir=None):
+    """Create a session with its own output directory for a newly uploaded PDF."""
+    doc_id = doc_id or uuid.uuid4().hex
+    output_dir = DOCUMENTS_DIR / doc_id
+    session = DocumentSession(doc_id, output_dir / pdf_filename, Path(pdf_filename).stem, output_dir, artifacts_dir)
+    session.edit_log = EditLog(
+        output_dir / "all_reading_orders.json", output_dir / "edit_log.jsonl", compact_every=EDIT_LOG_COMPACT_EVERY
+    )
+    return session_store.add(session)
+
+def recover_edits(session):
+    """Re-apply edits saved for this document by an earlier session (snapshot plus replayed log)."""
+    with session.lock:
+        recovered = session.edit_log.recover(session.refs, session.text_dic)
+        if recovered is not None:
+            session.refs, session.text_dic, session.revision = recovered
+            print(f"Recovered edits for {session.doc_id} at revision {session.revision}")
+
+async def _upload_file_chunks(upload: UploadFile):
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+async def stream_upload_to_disk(chunks, dest_dir: Path):
+    """
+    Write an async iterable of byte chunks to a temporary file in dest_dir,
+    hashing them as they arrive. Returns (temp_path, sha256 hex digest, size).
+    Raises 413 as soon as MAX_UPLOAD_MB is exceeded.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest_dir / f".upload-{uuid.uuid4().hex}.part"
     try:
-        # Step 1: Generate initial JSON from document
-        output_path_json = pdf_to_json(PDF_PATH, document)
-        
-        # Step 2: Load the JSON
-        with open(output_path_json, "r", encoding="utf-8") as f:
-            x = json.load(f)
-        
-        # Step 3: Process reading order (same logic as Streamlit)
-        final_refs = refs.copy()
-        
-        # Remove group children, picture captions, and table captions
-        group_lis = []
-        for i in group_dic.values():
-            for j in i:
-                group_lis.append(j)
-        
-        for i in group_lis:
-            if i in final_refs:
-                final_refs.remove(i)
-        
-        pic_text_lis = []
-        for i in pic_tex.values():
-            for j in i:
-                pic_text_lis.append(j)
-        
-        for i in pic_text_lis:
-            if i in final_refs:
-                final_refs.remove(i)
-        
-        table_text_lis = []
-        for i in table_tex.values():
-            for j in i:
-                table_text_lis.append(j)
-        
-        for i in table_text_lis:
-            if i in final_refs:
-                final_refs.remove(i)
-        
-        # Step 4: Create children array with cleaned refs
-        children = [{"$ref": r} for r in final_refs]
-        
-        # Step 5: Update body children with new order
-        x["body"]["children"] = children
-        
-        # Step 6: Update text content with edited texts
-        for i in x.get("texts", []):
-            if i.get("self_ref") in text_dic:
-                i["text"] = text_dic[i["self_ref"]]
-        
-        # Step 7: Save the complete modified JSON
-        complete_json_path = OUTPUT_DIR / f"{PDF_PATH.stem}_complete_edited.json"
-        with open(complete_json_path, "w", encoding="utf-8") as f:
-            json.dump(x, f, indent=4)
-        
-        # Step 8: Generate markdown from the complete edited JSON
-        markdown_path = json_loader(complete_json_path)
-        markdown_content = read_markdown_file(markdown_path)
-        
-        # Step 9: Save markdown to file
-        markdown_file_path = OUTPUT_DIR / f"{PDF_PATH.stem}_complete_edited.md"
-        with open(markdown_file_path, "w", encoding="utf-8") as f:
-            f.write(markdown_content)
-        
+        async with aiofiles.open(tmp_path, "wb") as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"PDF exceeds the {MAX_UPLOAD_MB} MB upload limit.")
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+@app.post("/upload_pdf")
+async def upload_pdf(request: Request, filename: str = None, overlay: str = "server"):
+    """
+    Accept a PDF either as a raw request body (Content-Type: application/pdf,
+    name in ?filename=), which is streamed straight to disk, or as multipart
+    form field "file". The SHA-256 of the content becomes the document id, so
+    re-uploading a document that is processed or processing reuses its session.
+    With overlay=client annotated page images are no longer rendered eagerly
+    or alongside plain pages, only when requested; the client draws boxes from
+    /page_overlay instead. Re-uploads share the session, so any upload
+    without overlay=client turns implicit annotated rendering back on.
+    """
+    if overlay not in ("server", "client"):
+        raise HTTPException(status_code=400, detail="overlay must be server or client")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"PDF exceeds the {MAX_UPLOAD_MB} MB upload limit.")
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="file is required")
+        filename = upload.filename
+        chunks = _upload_file_chunks(upload)
+    else:
+        chunks = request.stream()
+    pdf_filename = Path(filename or "document.pdf").name
+
+    tmp_path, doc_id, size = await stream_upload_to_disk(chunks, DOCUMENTS_DIR)
+    # Session setup touches the disk (cache lookup, structure restore, edit recovery); keep it off the event loop
+    session, outcome = await run_in_threadpool(register_upload, tmp_path, doc_id, pdf_filename, overlay)
+    if outcome == "duplicate":
         return {
-            "json_path": str(complete_json_path),
-            "markdown_path": str(markdown_file_path),
-            "message": "Complete edited JSON and markdown saved successfully"
+            "message": "PDF already uploaded.", "job_id": session.job_id, "doc_id": doc_id,
+            "image_version": page_image_version(session), "duplicate": True,
         }
-        
-    except Exception as e:
-        _log.exception("Error saving complete edited JSON and markdown")
-        raise HTTPException(status_code=500, detail=f"Error saving complete edited JSON and markdown: {e}")
-
-def clear_output_dir():
-    for item in OUTPUT_DIR.iterdir():
-        # Always clear these subfolders and all files
-        if item.is_dir() and item.name in ["page_images", "annotated_images", "boxes"]:
-            shutil.rmtree(item)
-            item.mkdir(exist_ok=True)
-        elif item.is_file():
-            item.unlink()
-        elif item.is_dir():
-            shutil.rmtree(item)
+    print(f"Received {pdf_filename}: {size} bytes, sha256 {doc_id}")
 
-@app.post("/upload_pdf")
-async def upload_pdf(file: UploadFile = File(...)):
-    global LAST_UPLOADED_PDF_NAME, PDF_PATH
-    clear_output_dir()  # Clear output and subfolders before saving new file
-    pdf_filename = Path(file.filename).name
-    PDF_PATH = OUTPUT_DIR / pdf_filename
-    with open(PDF_PATH, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    LAST_UPLOADED_PDF_NAME = Path(file.filename).stem
-    try:
-        process_pdf(PDF_PATH)
-    except Exception as e:
-        _log.exception("Docling extraction failed")
-        raise HTTPException(status_code=500, detail=f"Docling extraction failed: {e}")
-    return {"message": "PDF processed successfully."}
+    if outcome == "cached":
+        # Converted before with the same options: no Docling run needed
+        update_job(
+            session.job_id, status="done", stage="done", converted=True, timings={"cache_hit": True},
+            pages_total=session.pages_count, boxes_written=session.pages_count, finished_at=time.time(),
+        )
+        return {
+            "message": "PDF loaded from conversion cache.", "job_id": session.job_id, "doc_id": doc_id,
+            "image_version": page_image_version(session), "cached": True,
+        }
+    job_executor.submit(run_pdf_job, session.job_id, session)
+    return {
+        "message": "PDF upload accepted.", "job_id": session.job_id, "doc_id": doc_id,
+        "image_version": page_image_version(session),
+    }
+
+def register_upload(tmp_path, doc_id, pdf_filename, overlay):
+    """
+    Attach an uploaded PDF to its session. Returns (session, outcome): outcome
+    is "duplicate" for a document already processed or processing, "cached"
+    when its conversion was restored from the conversion cache, else "new".
+    """
+    with upload_lock:
+        session = live_session(doc_id)
+        existing_job = get_job(session.job_id) if session is not None and session.job_id else None
+        if existing_job is None and session is not None and session.pages_count is not None:
+            # Its job record expired, but the session itself is complete
+            session.job_id = create_job(status="done", stage="done", finished_at=time.time())
+            update_job(session.job_id, converted=True, pages_total=session.pages_count, boxes_written=session.pages_count)
+            existing_job = get_job(session.job_id)
+        if existing_job is not None and existing_job["status"] != "failed":
+            tmp_path.unlink(missing_ok=True)
+            session.client_overlay = session.client_overlay and overlay == "client"
+            return session, "duplicate"
+        artifacts_dir = conversion_cache.entry_dir(doc_id, options_fingerprint())
+        session = create_session(pdf_filename, doc_id=doc_id, artifacts_dir=artifacts_dir)
+        session.client_overlay = overlay == "client"
+        os.replace(tmp_path, session.pdf_path)
+        session.job_id = create_job()
+        structure = conversion_cache.load_structure(artifacts_dir)
+        if structure is None:
+            return session, "new"
+        restore_session_structure(session, structure)
+        recover_edits(session)
+    return session, "cached"
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
 
 @app.get("/pages_count")
-def get_pages_count():
-    count_file = OUTPUT_DIR / "pages_count.txt"
-    if not count_file.exists():
+def get_pages_count(doc_id: str):
+    session = require_session(doc_id)
+    if session.pages_count is None:
         raise HTTPException(status_code=404, detail="No PDF processed yet.")
-    with open(count_file) as f:
-        count = int(f.read().strip())
-    return {"pages": count}
+    return {"pages": session.pages_count, "image_version": page_image_version(session)}
 
 @app.get("/page_image/{page_no}")
-def get_page_image(page_no: int):
-    img_path = PAGE_IMAGES_DIR / f"page_{page_no}.png"
-    if not img_path.exists():
-        raise HTTPException(status_code=404, detail="Page image not found.")
-    return FileResponse(str(img_path), media_type="image/png")
+def get_page_image(page_no: int, doc_id: str, request: Request, v: str = None, tier: str = "full"):
+    """
+    Page image; pass v=<image_version from /upload_pdf or /pages_count> for an
+    immutable, cacheable URL, and tier=preview for the low-resolution version.
+    """
+    session = require_session(doc_id)
+    return page_image_response(session, page_no, request, v, annotated=False, tier=tier)
 
 @app.get("/annotated_page_image/{page_no}")
-def get_annotated_page_image(page_no: int):
-    img_path = ANNOTATED_IMAGES_DIR / f"annotated_page_{page_no}.png"
-    if not img_path.exists():
-        raise HTTPException(status_code=404, detail="Annotated page image not found.")
-    return FileResponse(str(img_path), media_type="image/png")
+def get_annotated_page_image(page_no: int, doc_id: str, request: Request, v: str = None, tier: str = "full"):
+    session = require_session(doc_id)
+    return page_image_response(session, page_no, request, v, annotated=True, tier=tier)
+
+@app.get("/page_tiles/{page_no}")
+def get_page_tiles(page_no: int, doc_id: str, annotated: bool = None):
+    """
+    Tile pyramid geometry of a page, for zooming clients that fetch
+    /page_tile/{page_no}/{level}/{col}/{row}. Tiles are cut from the annotated
+    image unless the document was uploaded with overlay=client.
+    """
+    session = require_session(doc_id)
+    if annotated is None:
+        annotated = not session.client_overlay
+    return {"tile_size": TILE_SIZE, "levels": page_tile_levels(session, page_no, annotated)}
+
+@app.get("/page_tile/{page_no}/{level}/{col}/{row}")
+def get_page_tile_image(page_no: int, level: int, col: int, row: int, doc_id: str, request: Request,
+                        annotated: bool = None, v: str = None):
+    session = require_session(doc_id)
+    if annotated is None:
+        annotated = not session.client_overlay
+    if level < 0 or col < 0 or row < 0:
+        raise HTTPException(status_code=404, detail="Tile not found.")
+    etag_key = f"{page_no}-{'annotated' if annotated else 'page'}-tile-{level}-{col}-{row}"
+    return image_file_response(
+        session, request, v, etag_key, lambda: get_page_tile(session, page_no, level, col, row, annotated)
+    )
+
+@app.get("/page_overlay/{page_no}")
+def get_page_overlay(page_no: int, doc_id: str):
+    """
+    Overlay geometry for clients that draw boxes themselves (uploads with
+    overlay=client): one rect per box, in reading order, in page-image pixels.
+    """
+    session = require_session(doc_id)
+    if session.pages_count is None or not 0 <= page_no < session.pages_count:
+        raise HTTPException(status_code=404, detail="Page not found.")
+    page_height = get_page_height(session, page_no)
+    rects = []
+    for row in edited_page_rows(session, page_no):
+        x0, y0, x1, y1 = row_pixel_bounds(row, page_height)
+        rects.append({"self_ref": row[0], "x": x0, "y": y0, "w": x1 - x0, "h": y1 - y0})
+    return {"dpi": PAGE_IMAGE_DPI, "rects": rects}
+
+@app.get("/picture/{picture_no}")
+def get_picture(picture_no: int, doc_id: str, size: int = None):
+    """Picture bytes for a block's /picture URL; size picks a thumbnail whose longest edge fits it."""
+    session = require_session(doc_id)
+    return FileResponse(picture_path(session, picture_no, size), headers={"Cache-Control": PICTURE_CACHE_CONTROL})
 
 @app.get("/bounding_boxes/{page_no}")
-def get_bounding_boxes(page_no: int):
-    box_path = BOXES_DIR / f"boxes_{page_no}.json"
-    if not box_path.exists():
-        raise HTTPException(status_code=404, detail="Bounding boxes not found.")
-    with open(box_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    # print(f"✅ Data loaded: {data}")
-    return JSONResponse(content=data)
+def get_bounding_boxes(page_no: int, doc_id: str):
+    session = require_session(doc_id)
+    return Response(content=get_page_box_bytes(session, page_no), media_type="application/json")
+
+@app.get("/page_items/{page_no}/at")
+def page_items_at_point(page_no: int, doc_id: str, x: float, y: float):
+    """Items under a point, innermost first. Coordinates are page-image pixels, like the overlay rects."""
+    session = require_session(doc_id)
+    return spatial_results(get_page_index(session, page_no).at_point(x, y))
+
+@app.get("/page_items/{page_no}/in_rect")
+def page_items_in_rect(page_no: int, doc_id: str, x0: float, y0: float, x1: float, y1: float, contained: bool = False):
+    """Items overlapping a rectangle, or only those fully inside it with contained=true (drag selection)."""
+    session = require_session(doc_id)
+    return spatial_results(get_page_index(session, page_no).in_rect(x0, y0, x1, y1, contained))
+
+@app.get("/page_items/{page_no}/nearest")
+def page_items_nearest(page_no: int, doc_id: str, x: float, y: float, k: int = 1):
+    session = require_session(doc_id)
+    return spatial_results(get_page_index(session, page_no).nearest(x, y, k))
 
 @app.post("/save_all_orders")
-async def save_all_orders(order_data: dict = Body(...)):
-    global refs, text_dic
-    
-    # Update the reading order
-    if "order" in order_data and isinstance(order_data["order"], list):
-        refs = order_data["order"]
-    
-    # Update text content
-    if "texts" in order_data and isinstance(order_data["texts"], dict):
-        for self_ref, text_content in order_data["texts"].items():
-            text_dic[self_ref] = text_content
-
-    # Save to file for persistence
-    order_path = OUTPUT_DIR / "all_reading_orders.json"
-    with open(order_path, "w", encoding="utf-8") as f:
-        json.dump({"refs": refs, "texts": text_dic}, f, indent=2)
+def save_all_orders(doc_id: str, order_data: dict = Body(...)):
+    session = require_session(doc_id)
+
+    with session.lock:
+        # Update the reading order
+        if "order" in order_data and isinstance(order_data["order"], list):
+            if not all(isinstance(ref, str) for ref in order_data["order"]):
+                raise HTTPException(status_code=400, detail="order must be a list of refs")
+            session.refs = order_data["order"]
         
-    return {"message": "All orders and text changes saved."}
+        # Update text content
+        if "texts" in order_data and isinstance(order_data["texts"], dict):
+            for self_ref, text_content in order_data["texts"].items():
+                session.text_dic[self_ref] = text_content
+
+        # Exports generated before this point are now stale
+        session.revision += 1
+
+        # A full save is a compaction: new snapshot, empty edit log
+        session.edit_log.compact(session.refs, session.text_dic, session.revision)
+        
+    return {"message": "All orders and text changes saved.", "revision": session.revision}
+
+@app.post("/save_order_patch")
+def save_order_patch(doc_id: str, patch: dict = Body(...)):
+    """
+    Apply a batch of edit operations ({"ops": [...]}, see edit_log.apply_ops)
+    in place and append it to the document's edit log. The whole batch is
+    rejected if any operation is invalid. With "base_revision", the batch is
+    refused with 409 if someone else saved in between.
+    """
+    session = require_session(doc_id)
+    ops = patch.get("ops")
+    if not isinstance(ops, list) or not ops:
+        raise HTTPException(status_code=400, detail="ops must be a non-empty list")
+
+    with session.lock:
+        base_revision = patch.get("base_revision")
+        if base_revision is not None and base_revision != session.revision:
+            raise HTTPException(status_code=409, detail=f"Document is at revision {session.revision}, not {base_revision}.")
+        try:
+            apply_ops(session.refs, session.text_dic, ops)
+        except PatchError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        session.revision += 1
+        session.edit_log.append(session.revision, ops)
+        if session.edit_log.needs_compaction():
+            session.edit_log.compact(session.refs, session.text_dic, session.revision)
+
+    return {"message": f"{len(ops)} edits saved.", "revision": session.revision}
+
+@app.post("/auto_reading_order")
+def auto_reading_order(doc_id: str, page_no: int = None, apply: bool = True):
+    """
+    Propose a reading order from block geometry (reading_order.page_order) for
+    one page, or every page when page_no is omitted. With apply, the proposal
+    takes the place of those blocks in the reading order, saved like a full
+    save, and /bounding_boxes serves the pages in the new order.
+    """
+    session = require_session(doc_id)
+    if session.pages_count is None:
+        raise HTTPException(status_code=409, detail="Document is still being processed.")
+    pages = range(session.pages_count) if page_no is None else [page_no]
+    start = time.perf_counter()
+    proposed = {}
+    for page in pages:
+        rows = page_box_rows(session, page)
+        height = get_page_height(session, page)
+        boxes = [(left, height - top, right, height - bottom) for _, _, left, top, right, bottom, *_ in rows]
+        proposed[page] = [rows[i] for i in page_order(boxes)]
+    result = {
+        "pages": {page: [row[0] for row in rows] for page, rows in proposed.items()},
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+    if not apply:
+        return result
+
+    with session.lock:
+        # The reordered refs keep the slots they held in the reading order; only their order changes
+        current = set(session.refs)
+        moved = list(dict.fromkeys(
+            row[0] for page in sorted(proposed) for row in proposed[page] if row[0] in current
+        ))
+        # A ref saved more than once (an item with several boxes) keeps only its first slot
+        moved_set = set(moved)
+        next_ref = iter(moved)
+        filled = set()
+        refs = []
+        for ref in session.refs:
+            if ref not in moved_set:
+                refs.append(ref)
+            elif ref not in filled:
+                filled.add(ref)
+                refs.append(next(next_ref))
+        session.refs = refs
+        # /bounding_boxes orders pages by refs, so the new order survives restarts and cache restores
+        session.revision += 1
+        session.edit_log.compact(session.refs, session.text_dic, session.revision)
+    result["revision"] = session.revision
+    return result
+
+@app.get("/get_reading_order")
+def get_reading_order(doc_id: str):
+    session = require_session(doc_id)
+    with session.lock:
+        return {"refs": list(session.refs), "texts": dict(session.text_dic), "revision": session.revision}
 
 @app.post("/export_markdown")
-def export_markdown():
-    global document
-    if not document:
-        raise HTTPException(status_code=400, detail="No document processed. Please upload a PDF first.")
+def export_markdown(doc_id: str, images: str = "embedded"):
+    """
+    Markdown export. images=embedded inlines pictures as base64; images=referenced
+    links them as assets/<hash>.<ext> (served by /export_assets) and streams
+    the markdown from disk.
+    """
+    session = require_session(doc_id)
+    if images == "referenced":
+        try:
+            markdown_path = save_markdown_with_assets(session)
+        except Exception as e:
+            _log.exception("Error exporting markdown with assets")
+            raise HTTPException(status_code=500, detail=f"Error exporting to markdown: {e}")
+        return StreamingResponse(
+            iter_file(markdown_path),
+            media_type="text/markdown",
+            headers={"Content-Disposition": f'attachment; filename="{session.name}.md"'}
+        )
+    if images != "embedded":
+        raise HTTPException(status_code=400, detail="images must be embedded or referenced")
+    document = get_session_document(session)
     try:
-        modified_json_path = generate_and_modify_json(PDF_PATH, document)
-        markdown_path = json_loader(modified_json_path)
-        markdown_content = read_markdown_file(markdown_path)
+        markdown_content = export_markdown_text(generate_and_modify_json(session, document))
         return PlainTextResponse(
             markdown_content, 
             media_type="text/markdown",
@@ -532,71 +1313,74 @@ def export_markdown():
         _log.exception("Error exporting markdown")
         raise HTTPException(status_code=500, detail=f"Error exporting to markdown: {e}")
 
+@app.get("/export_assets/{name}")
+def get_export_asset(name: str, doc_id: str):
+    """An image asset of the referenced markdown export. Names are content hashes, so they never change."""
+    session = require_session(doc_id)
+    _, assets_dir = markdown_assets_paths(session)
+    asset_path = assets_dir / name
+    if Path(name).name != name or not asset_path.is_file():
+        raise HTTPException(status_code=404, detail="Asset not found.")
+    return FileResponse(asset_path, headers={"Cache-Control": PICTURE_CACHE_CONTROL})
+
 @app.get("/export_json")
-def export_json():
-    global document
-    if not document:
-        raise HTTPException(status_code=400, detail="No document processed. Please upload a PDF first.")
+def export_json(doc_id: str):
+    session = require_session(doc_id)
+    document = get_session_document(session)
     try:
-        modified_json_path = generate_and_modify_json(PDF_PATH, document)
-        return FileResponse(
-            modified_json_path,
+        x = generate_and_modify_json(session, document)
+        return Response(
+            json.dumps(x, ensure_ascii=False).encode("utf-8"),
             media_type="application/json",
-            filename=f"{PDF_PATH.stem}_modified.json"
+            headers={"Content-Disposition": f'attachment; filename="{session.name}_modified.json"'}
         )
     except Exception as e:
         _log.exception("Error exporting json")
         raise HTTPException(status_code=500, detail=f"Error exporting to JSON: {e}")
 
 @app.post("/save_complete_json_and_markdown")
-async def save_complete_json_and_markdown_endpoint():
+def save_complete_json_and_markdown_endpoint(doc_id: str):
     """Save complete edited JSON including all groups, text, tables and generate markdown"""
-    return save_complete_edited_json_and_markdown()
+    return save_complete_edited_json_and_markdown(require_session(doc_id))
 
 @app.get("/download_complete_edited_json")
-def download_complete_edited_json():
-    """Download the complete edited JSON file"""
-    global document
-    if not document:
-        raise HTTPException(status_code=400, detail="No document processed. Please upload a PDF first.")
+def download_complete_edited_json(doc_id: str, request: Request):
+    """Download the complete edited JSON file for the current edit revision"""
+    session = require_session(doc_id)
+    if etag_matches(request, export_etag(session, "json")):
+        return Response(status_code=304, headers={"ETag": export_etag(session, "json")})
     
     try:
-        # Check if the complete edited JSON already exists
-        complete_json_path = OUTPUT_DIR / f"{PDF_PATH.stem}_complete_edited.json"
-        
-        if not complete_json_path.exists():
-            # Generate the complete edited JSON if it doesn't exist
-            result = save_complete_edited_json_and_markdown()
-            json_path = Path(result["json_path"])
-        else:
-            json_path = complete_json_path
-        
+        result = save_complete_edited_json_and_markdown(session)
         return FileResponse(
-            json_path,
+            result["json_path"],
             media_type="application/json",
-            filename=f"{PDF_PATH.stem}_complete_edited.json"
+            filename=f"{session.name}_complete_edited.json",
+            headers={"ETag": export_etag(session, "json", result["revision"]), "Cache-Control": "no-cache"}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         _log.exception("Error downloading complete edited JSON")
         raise HTTPException(status_code=500, detail=f"Error downloading complete edited JSON: {e}")
 
 @app.get("/download_complete_edited_markdown")
-def download_complete_edited_markdown():
-    """Download the complete edited markdown file"""
-    global document
-    if not document:
-        raise HTTPException(status_code=400, detail="No document processed. Please upload a PDF first.")
+def download_complete_edited_markdown(doc_id: str, request: Request):
+    """Download the complete edited markdown file for the current edit revision"""
+    session = require_session(doc_id)
+    if etag_matches(request, export_etag(session, "md")):
+        return Response(status_code=304, headers={"ETag": export_etag(session, "md")})
     
     try:
-        # Generate the complete edited JSON and markdown
-        result = save_complete_edited_json_and_markdown()
-        markdown_path = Path(result["markdown_path"])
-        
+        result = save_complete_edited_json_and_markdown(session)
         return FileResponse(
-            markdown_path,
+            result["markdown_path"],
             media_type="text/markdown",
-            filename=f"{PDF_PATH.stem}_complete_edited.md"
+            filename=f"{session.name}_complete_edited.md",
+            headers={"ETag": export_etag(session, "md", result["revision"]), "Cache-Control": "no-cache"}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         _log.exception("Error downloading complete edited markdown")
         raise HTTPException(status_code=500, detail=f"Error downloading complete edited markdown: {e}")
@@ -604,22 +1388,22 @@ def download_complete_edited_markdown():
 
 def process_local_pdf(pdf_path: str):
     """Process a local PDF file (similar to Streamlit approach)"""
-    global document
-    
     pdf_path_obj = Path(pdf_path)
     if not pdf_path_obj.exists():
         raise HTTPException(status_code=404, detail=f"PDF file not found: {pdf_path}")
     
+    session = create_session(pdf_path_obj.name)
+    session.pdf_path = pdf_path_obj
     try:
         # Process the PDF
-        process_pdf(pdf_path_obj)
-        return {"message": f"Local PDF processed successfully: {pdf_path}"}
+        process_pdf(session)
+        return {"message": f"Local PDF processed successfully: {pdf_path}", "doc_id": session.doc_id}
     except Exception as e:
         _log.exception("Local PDF processing failed")
         raise HTTPException(status_code=500, detail=f"Local PDF processing failed: {e}")
 
 @app.post("/process_local_pdf")
-async def process_local_pdf_endpoint(pdf_data: dict = Body(...)):
+def process_local_pdf_endpoint(pdf_data: dict = Body(...)):
     """Process a local PDF file"""
     if "pdf_path" not in pdf_data:
         raise HTTPException(status_code=400, detail="pdf_path is required")
@@ -627,25 +1411,112 @@ async def process_local_pdf_endpoint(pdf_data: dict = Body(...)):
     pdf_path = pdf_data["pdf_path"]
     return process_local_pdf(pdf_path)
 
+def publish_page(job_id, markdown_path, assets_dir=None):
+    """Publish one markdown file for a publish job and record its outcome."""
+    key = str(markdown_path)
+    with jobs_lock:
+        jobs[job_id]["status"] = jobs[job_id]["stage"] = "running"
+        jobs[job_id]["pages"][key]["status"] = "running"
+    try:
+        page = publish_markdown_file(markdown_path, assets_dir)
+        outcome = {"status": "skipped" if page["action"] == "unchanged" else page["action"], "url": page["url"]}
+        counter = "skipped" if page["action"] == "unchanged" else "published"
+    except Exception as e:
+        outcome = {"status": "failed", "error": str(e)}
+        counter = "failed"
+    with jobs_lock:
+        job = jobs[job_id]
+        job["pages"][key].update(outcome)
+        job["progress"][counter] += 1
+        progress = job["progress"]
+        if progress["published"] + progress["skipped"] + progress["failed"] == progress["pages_total"]:
+            job["status"] = job["stage"] = "done"
+            job["finished_at"] = time.time()
+
+def publish_sources(doc_ids=(), paths=(), images="embedded"):
+    """
+    Markdown files to publish, as {path: assets_dir or None}: each document's
+    latest export (with external image assets when images=referenced), plus
+    .md files or directories of them under OUTPUT_DIR, whose assets/ links are
+    uploaded when an assets directory sits next to them.
+    """
+    output_root = OUTPUT_DIR.resolve()
+    files = {}
+    for doc_id in doc_ids:
+        session = require_session(doc_id)
+        if images == "referenced":
+            markdown_path, assets_dir = save_markdown_with_assets(session), markdown_assets_paths(session)[1]
+        else:
+            markdown_path, assets_dir = session.output_dir / f"{session.name}_complete_edited.md", None
+        if not markdown_path.exists():
+            raise HTTPException(status_code=404, detail=f"Markdown not exported yet for {doc_id}.")
+        files[markdown_path] = assets_dir
+    for path in paths:
+        path = Path(path).resolve()
+        # Only this server's own output may be published, never arbitrary files on the host
+        if not path.is_relative_to(output_root):
+            raise HTTPException(status_code=403, detail=f"{path} is outside the output directory.")
+        if path.is_dir():
+            markdown_paths = sorted(p.resolve() for p in path.glob("*.md"))
+        elif path.suffix == ".md" and path.exists():
+            markdown_paths = [path]
+        else:
+            raise HTTPException(status_code=404, detail=f"No markdown found at {path}.")
+        for markdown_path in markdown_paths:
+            if not markdown_path.is_relative_to(output_root):
+                raise HTTPException(status_code=403, detail=f"{markdown_path} is outside the output directory.")
+            assets_dir = markdown_path.parent / "assets"
+            files[markdown_path] = assets_dir if assets_dir.is_dir() else None
+    return files
+
+@app.post("/publish_to_wiki")
+def publish_to_wiki(request_data: dict = Body(...)):
+    """
+    Publish many markdown files to Wiki.js in the background. Takes "doc_ids"
+    (their exported markdown) and/or "paths" (.md files or directories under
+    the output directory) and
+    returns a job id; GET /jobs/{job_id} reports the status of every page.
+    Uploads run at most WIKI_PUBLISH_CONCURRENCY at a time, and pages whose
+    content matches what was last published are skipped without a request.
+    With "images": "referenced", documents publish their markdown with
+    external image assets (see /export_markdown).
+    """
+    files = publish_sources(
+        request_data.get("doc_ids") or [], request_data.get("paths") or [], request_data.get("images", "embedded")
+    )
+    if not files:
+        raise HTTPException(status_code=400, detail="Nothing to publish.")
+    job_id = create_job(
+        progress={"published": 0, "skipped": 0, "failed": 0, "pages_total": len(files)},
+        pages={str(path): {"status": "queued"} for path in files},
+    )
+    for path, assets_dir in files.items():
+        publish_executor.submit(publish_page, job_id, path, assets_dir)
+    return {"job_id": job_id, "pages_total": len(files)}
+
 @app.post("/upload_to_wiki")
-def upload_to_wiki():
+def upload_to_wiki(doc_id: str, images: str = "embedded"):
     """
-    Upload the latest generated markdown to Wiki.js and return the page URL.
+    Upload the document's latest generated markdown to Wiki.js and return the page URL.
+    With images=referenced, pictures go to the Wiki.js asset store and the page links them.
     """
-    global LAST_UPLOADED_PDF_NAME
-    if not LAST_UPLOADED_PDF_NAME:
+    session = session_store.get(doc_id)
+    if session is None:
         return JSONResponse({"error": "No PDF uploaded yet."}, status_code=404)
-    markdown_path = OUTPUT_DIR / f"{LAST_UPLOADED_PDF_NAME}_complete_edited.md"
+    markdown_path = session.output_dir / f"{session.name}_complete_edited.md"
+    assets_dir = None
+    if images == "referenced":
+        markdown_path, assets_dir = save_markdown_with_assets(session), markdown_assets_paths(session)[1]
     if not markdown_path.exists():
         return JSONResponse({"error": "Markdown file not found. Please export markdown first."}, status_code=404)
     # Call the upload function and capture the URL
     try:
         # Patch: capture the URL from the upload function
         # We'll modify upload_markdown_to_wikijs to return the URL
-        wiki_url = upload_markdown_to_wikijs(str(markdown_path))
+        wiki_url = upload_markdown_to_wikijs(str(markdown_path), assets_dir)
         if wiki_url:
             return {"wiki_url": wiki_url}
         else:
             return JSONResponse({"error": "Wiki.js upload failed."}, status_code=500)
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse({"error": str(e)}, status_code=500)
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+# Same look as the old matplotlib overlay: light blue fill, black edge, both at 30% opacity
+BOX_FILL = np.array([0xA2, 0xCF, 0xFE], dtype=np.float32)
+BOX_EDGE = np.array([0x00, 0x00, 0x00], dtype=np.float32)
+BOX_ALPHA = 0.3
+
+IMAGE_FORMATS = {"png": "PNG", "webp": "WEBP", "jpeg": "JPEG"}
+IMAGE_SUFFIXES = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+
+def _blend(region, color, alpha):
+    region[...] = (region * (1.0 - alpha) + color * alpha).astype(np.uint8)
+
+
+def draw_boxes(pixels, rects, alpha=BOX_ALPHA):
+    """
+    Composite box overlays in place onto an (height, width, 3) uint8 array.
+    rects are (x, y, w, h) in pixel space with a top-left origin.
+    """
+    height, width = pixels.shape[:2]
+    for x, y, w, h in rects:
+        x0 = max(int(round(x)), 0)
+        y0 = max(int(round(y)), 0)
+        x1 = min(int(round(x + w)), width)
+        y1 = min(int(round(y + h)), height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        _blend(pixels[y0:y1, x0:x1], BOX_FILL, alpha)
+        # 1px edge on each side, drawn over the fill like matplotlib does
+        _blend(pixels[y0, x0:x1], BOX_EDGE, alpha)
+        _blend(pixels[y1 - 1, x0:x1], BOX_EDGE, alpha)
+        _blend(pixels[y0 + 1:y1 - 1, x0], BOX_EDGE, alpha)
+        _blend(pixels[y0 + 1:y1 - 1, x1 - 1], BOX_EDGE, alpha)
+    return pixels
+
+
+def write_atomically(path, write):
+    """
+    Call write(tmp_path) for a temporary file next to path, then move it into
+    place, so readers (which serve files as soon as they exist) never see a
+    partly written image.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:8]}{path.suffix}")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def save_image(image, path, image_format="png", quality=80):
+    """
+    Encode a PIL image or (h, w, 3) uint8 array to a path (atomically) or a
+    file object. WebP and JPEG are lossy at quality; PNG is lossless.
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    options = {} if image_format == "png" else {"quality": quality}
+    if isinstance(path, (str, os.PathLike)):
+        write_atomically(path, lambda tmp_path: image.save(tmp_path, IMAGE_FORMATS[image_format], **options))
+    else:
+        image.save(path, IMAGE_FORMATS[image_format], **options)
+
+
+def render_page(page, dpi, rects, page_image_path, annotated_image_path,
+                image_format="png", quality=80, preview_paths=None, preview_factor=3):
+    """
+    Rasterize a PyMuPDF page once, save it, then draw rects on the same pixel
+    buffer and save the annotated copy. With preview_paths (page, annotated),
+    both are also saved downscaled by preview_factor. Any path may be None to
+    skip that output; without annotated outputs no overlay is drawn at all.
+    """
+    preview_path, annotated_preview_path = preview_paths or (None, None)
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if page_image_path is None:
+        pass
+    elif image_format == "png":
+        write_atomically(page_image_path, lambda tmp_path: pix.save(str(tmp_path)))
+    else:
+        save_image(pixels[..., :3], page_image_path, image_format, quality)
+    if preview_path is not None:
+        save_image(Image.fromarray(pixels[..., :3]).reduce(preview_factor), preview_path, image_format, quality)
+    if annotated_image_path is None and annotated_preview_path is None:
+        return
+
+    if not pixels.flags.writeable:
+        pixels = pixels.copy()
+    draw_boxes(pixels[..., :3], rects)
+    annotated = Image.fromarray(pixels[..., :3])
+    if annotated_image_path is not None:
+        save_image(annotated, annotated_image_path, image_format, quality)
+    if annotated_preview_path is not None:
+        save_image(annotated.reduce(preview_factor), annotated_preview_path, image_format, quality)
+
+
+def tile_levels(width, height, tile_size):
+    """Number of pyramid levels: level 0 is full size, each level halves it, the last fits one tile."""
+    return max(0, math.ceil(math.log2(max(width, height) / tile_size))) + 1
+
+
+def write_tiles(image_path, out_dir, level, tile_size, image_format="png", quality=80):
+    """Cut one pyramid level of an image into tile_size squares named {level}_{col}_{row}. Returns the paths."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        if level:
+            image = image.reduce(2 ** level)
+        for row in range(math.ceil(image.height / tile_size)):
+            for col in range(math.ceil(image.width / tile_size)):
+                box = (col * tile_size, row * tile_size,
+                       min((col + 1) * tile_size, image.width), min((row + 1) * tile_size, image.height))
+                path = out_dir / f"{level}_{col}_{row}{IMAGE_SUFFIXES[image_format]}"
+                save_image(image.crop(box), path, image_format, quality)
+                paths.append(path)
+    return paths
+
+
+# PDFs opened by this (worker) process, so each worker opens a document once
+_open_pdfs = OrderedDict()
+_MAX_OPEN_PDFS = 4
+
+
+def _worker_pdf(pdf_path):
+    pdf = _open_pdfs.get(pdf_path)
+    if pdf is None:
+        pdf = fitz.open(pdf_path)
+        _open_pdfs[pdf_path] = pdf
+        while len(_open_pdfs) > _MAX_OPEN_PDFS:
+            _open_pdfs.popitem(last=False)[1].close()
+    else:
+        _open_pdfs.move_to_end(pdf_path)
+    return pdf
+
+
+def render_page_task(task):
+    """
+    Process one page described by a plain dict (picklable for process pools):
+    pdf_path, page_no, dpi, rects, page_image_path, annotated_image_path and,
+    optionally, image_format, quality, preview_paths and preview_factor, and
+    blocks to serialize to boxes_path. Returns (page_no, seconds).
+    """
+    start = time.perf_counter()
+    pdf = _worker_pdf(task["pdf_path"])
+    render_page(
+        pdf[task["page_no"]], task["dpi"], task["rects"], task["page_image_path"], task["annotated_image_path"],
+        image_format=task.get("image_format", "png"), quality=task.get("quality", 80),
+        preview_paths=task.get("preview_paths"), preview_factor=task.get("preview_factor", 3),
+    )
+    if task.get("boxes_path") is not None:
+        with open(task["boxes_path"], "w", encoding="utf-8") as f:
+            json.dump(task["blocks"], f, indent=2)
+    return task["page_no"], time.perf_counter() - start
+
+
+def render_pages(tasks, executor=None):
+    """Run render_page_task over tasks, yielding results in task order. Runs inline without an executor."""
+    if executor is None:
+        for task in tasks:
+            yield render_page_task(task)
+    else:
+        yield from executor.map(render_page_task, tasks)
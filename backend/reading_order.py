@@ -0,0 +1,72 @@
+import numpy as np
+
+# Minimum whitespace (PDF points) between two columns for a vertical cut, and
+# between two blocks for a horizontal cut
+COLUMN_GAP = 8.0
+ROW_GAP = 1.0
+# Blocks at least this fraction of the page's text width are treated as
+# spanning (titles, full-width figures) and split the page into bands
+SPAN_RATIO = 0.6
+
+
+def _cuts(starts, ends, min_gap):
+    """
+    Split intervals where the whitespace between them is at least min_gap.
+    Returns groups of indices in start order, or None if there is no gap.
+    """
+    order = np.argsort(starts, kind="stable")
+    reach = np.maximum.accumulate(ends[order])
+    split_after = np.nonzero(starts[order][1:] - reach[:-1] >= min_gap)[0]
+    if split_after.size == 0:
+        return None
+    return np.split(order, split_after + 1)
+
+
+def _xy_cut(boxes, ids):
+    """Recursive XY-cut over boxes[ids]: columns left to right first, then rows top to bottom."""
+    if ids.size <= 1:
+        return list(ids)
+    sub = boxes[ids]
+    groups = _cuts(sub[:, 0], sub[:, 2], COLUMN_GAP)
+    if groups is None:
+        groups = _cuts(sub[:, 1], sub[:, 3], ROW_GAP)
+    if groups is None:
+        # Overlapping blocks: plain top-to-bottom, left-to-right
+        return list(ids[np.lexsort((sub[:, 0], sub[:, 1]))])
+    order = []
+    for group in groups:
+        order.extend(_xy_cut(boxes, ids[group]))
+    return order
+
+
+def page_order(boxes):
+    """
+    Propose a reading order for one page. boxes is an (n, 4) array of
+    (x0, y0, x1, y1) in PDF points with a top-left origin; returns the box
+    indices in reading order.
+
+    Spanning blocks are taken out first and cut the page into horizontal
+    bands, so a full-width title or figure does not stop the columns above
+    and below it from being detected. Within each band the blocks are ordered
+    by recursive XY-cut.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) <= 1:
+        return list(range(len(boxes)))
+    widths = boxes[:, 2] - boxes[:, 0]
+    text_width = boxes[:, 2].max() - boxes[:, 0].min()
+    spanning = widths >= SPAN_RATIO * text_width
+
+    span_ids = np.nonzero(spanning)[0]
+    span_ids = span_ids[np.argsort(boxes[span_ids, 1], kind="stable")]
+    rest_ids = np.nonzero(~spanning)[0]
+    # Band k holds the blocks whose centre lies above the k-th spanning block
+    centres = (boxes[rest_ids, 1] + boxes[rest_ids, 3]) / 2
+    bands = np.searchsorted(boxes[span_ids, 1], centres)
+
+    order = []
+    for band in range(len(span_ids) + 1):
+        order.extend(_xy_cut(boxes, rest_ids[bands == band]))
+        if band < len(span_ids):
+            order.append(span_ids[band])
+    return [int(i) for i in order]
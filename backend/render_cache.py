@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class RenderCache:
+    """
+    Rendered page artifacts on disk, bounded by a byte budget.
+
+    Entries are keyed by file path. A miss calls render(), which must write the
+    requested file (and may write sibling files from the same rasterization,
+    returning every path it wrote). render() must write each file atomically
+    (temporary file, then rename), because an existing path counts as
+    finished and is served at once. Pages are served straight from these
+    files, so the OS page cache holds the hot ones; once over budget the least
+    recently used files are deleted and simply rendered again on the next
+    request.
+    """
+
+    def __init__(self, disk_budget):
+        self.disk_budget = disk_budget
+        self._disk = OrderedDict()  # path -> size on disk
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._render_locks = {}  # render key -> Lock, so concurrent requests render a page once
+
+    def ensure(self, path: Path, render_key, render):
+        """Make sure path exists on disk, rendering it if needed, and mark it recently used."""
+        if path.exists():
+            with self._lock:
+                self._touch_disk(str(path))
+            return
+        with self._lock:
+            render_lock = self._render_locks.setdefault(render_key, threading.Lock())
+        with render_lock:
+            if not path.exists():
+                written = render()
+                with self._lock:
+                    for written_path in written:
+                        self._touch_disk(str(written_path))
+                    self._evict_disk(keep={str(p) for p in written})
+        with self._lock:
+            self._render_locks.pop(render_key, None)
+
+    def register(self, paths):
+        """Account for files rendered outside the cache, e.g. by a process pool."""
+        with self._lock:
+            for path in paths:
+                self._touch_disk(str(path))
+            self._evict_disk(keep={str(p) for p in paths})
+
+    def _touch_disk(self, key):
+        if key in self._disk:
+            self._disk.move_to_end(key)
+            return
+        try:
+            size = Path(key).stat().st_size
+        except FileNotFoundError:
+            return
+        self._disk[key] = size
+        self._disk_bytes += size
+
+    def _evict_disk(self, keep=()):
+        for key in list(self._disk):
+            if self._disk_bytes <= self.disk_budget:
+                break
+            if key in keep:
+                continue
+            self._disk_bytes -= self._disk.pop(key)
+            Path(key).unlink(missing_ok=True)
@@ -0,0 +1,122 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+
+class DocumentSession:
+    """Editing state and output directories for one uploaded document."""
+
+    def __init__(self, doc_id, pdf_path: Path, name, output_dir: Path, artifacts_dir: Path = None):
+        self.doc_id = doc_id
+        self.pdf_path = pdf_path
+        self.name = name  # stem of the uploaded file, used for export file names
+        # Edits and exports go to output_dir; conversion artifacts (document, boxes,
+        # page images) to artifacts_dir, which may be a shared conversion cache entry
+        self.output_dir = output_dir
+        self.artifacts_dir = artifacts_dir or output_dir
+        self.page_images_dir = self.artifacts_dir / "page_images"
+        self.annotated_images_dir = self.artifacts_dir / "annotated_images"
+        self.previews_dir = self.artifacts_dir / "previews"
+        self.tiles_dir = self.artifacts_dir / "tiles"
+        self.boxes_dir = self.artifacts_dir / "boxes"
+        self.pictures_dir = self.artifacts_dir / "pictures"
+        self.document_json_path = self.artifacts_dir / "docling_document.json"
+        for d in (self.output_dir, self.page_images_dir, self.annotated_images_dir, self.previews_dir, self.boxes_dir, self.pictures_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.RLock()
+        self.last_used = time.time()  # last request for this document; recent sessions pin their cache entry
+        self.pages_count = None
+        self.job_id = None  # processing job that produced this session's outputs
+        self.client_overlay = False  # the frontend draws box overlays itself; annotated images only on request
+        # Bumped on every saved edit; export artifacts are regenerated only when it moves
+        self.epoch = uuid.uuid4().hex[:8]
+        self.revision = 0
+        self.exported_revision = None
+        self.exported_assets_revision = None  # same, for the markdown export with external image assets
+        self.edit_log = None  # edit_log.EditLog for this document's output_dir
+        self.page_rects = {}  # page_no -> overlay rects (x, y, w, h) in page-image pixels
+        self.page_boxes = {}  # page_no -> [(self_ref, page, l, t, r, b, label, content), ...]
+        self.page_box_bytes = {}  # page_no -> (revision, serialized box JSON served by /bounding_boxes)
+        self.ref_positions = None  # (revision, {ref: position in refs}), see main.ref_positions
+        self.page_heights = {}  # page_no -> page height in PDF points
+        self.page_indexes = {}  # page_no -> PageSpatialIndex, built on first query
+
+        # Loaded DoclingDocument, released on eviction
+        self.document = None
+        self.export_base = None  # document.export_to_dict(), computed on first export
+
+        # Reading order and text edits
+        self.group_dic = {}
+        self.pic_tex = {}
+        self.table_tex = {}
+        self.nested_refs = frozenset()  # group children and captions, left out of body.children
+        self.refs = []
+        self.text_dic = {}
+
+    def release_document(self):
+        # No lock: eviction runs while other sessions' locks may be held, and
+        # in-flight work keeps its own references to the released objects.
+        self.document = None
+        self.export_base = None
+
+
+class SessionStore:
+    """
+    Sessions keyed by document id. Every session stays addressable, but only the
+    most recently used DoclingDocuments are kept in memory: once the estimated
+    size of the loaded documents exceeds memory_budget, the least recently used
+    ones are released and reloaded from disk on next access.
+    """
+
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self._sessions = {}
+        self._loaded = OrderedDict()  # doc_id -> estimated bytes, least recently used first
+        self._lock = threading.Lock()
+
+    def add(self, session):
+        with self._lock:
+            self._sessions[session.doc_id] = session
+        return session
+
+    def get(self, doc_id):
+        with self._lock:
+            return self._sessions.get(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._loaded.pop(doc_id, None)
+            return self._sessions.pop(doc_id, None)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def mark_loaded(self, session, size):
+        """Record that session holds a document of roughly size bytes and evict others over budget."""
+        with self._lock:
+            self._loaded[session.doc_id] = size
+            self._loaded.move_to_end(session.doc_id)
+            evicted = []
+            total = sum(self._loaded.values())
+            while total > self.memory_budget and len(self._loaded) > 1:
+                doc_id, evicted_size = self._loaded.popitem(last=False)
+                total -= evicted_size
+                evicted.append(self._sessions[doc_id])
+        for other in evicted:
+            other.release_document()
+        return evicted
+
+    def release(self, session):
+        """Release session's document now, e.g. once it is ingested; it is reloaded on next access."""
+        with self._lock:
+            self._loaded.pop(session.doc_id, None)
+        session.release_document()
+
+    def touch(self, session):
+        with self._lock:
+            if session.doc_id in self._loaded:
+                self._loaded.move_to_end(session.doc_id)
@@ -0,0 +1,59 @@
+from rtree import index
+
+
+class PageSpatialIndex:
+    """
+    R-tree over the item boxes of one page, for hit-testing and region queries.
+
+    Boxes are (self_ref, (x0, y0, x1, y1)) in page-image pixels with a top-left
+    origin, the same space as the overlay rectangles. Results are
+    (self_ref, (x, y, w, h)) tuples.
+    """
+
+    def __init__(self, boxes):
+        self.refs = []
+        self.bounds = []
+        for ref, bounds in boxes:
+            x0, y0, x1, y1 = bounds
+            self.refs.append(ref)
+            self.bounds.append((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+        self._tree = index.Index()
+        for i, bounds in enumerate(self.bounds):
+            self._tree.insert(i, bounds)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def _result(self, ids):
+        results = []
+        for i in ids:
+            x0, y0, x1, y1 = self.bounds[i]
+            results.append((self.refs[i], (x0, y0, x1 - x0, y1 - y0)))
+        return results
+
+    def _area(self, i):
+        x0, y0, x1, y1 = self.bounds[i]
+        return (x1 - x0) * (y1 - y0)
+
+    def at_point(self, x, y):
+        """Items containing the point, innermost (smallest) first."""
+        ids = sorted(self._tree.intersection((x, y, x, y)), key=self._area)
+        return self._result(ids)
+
+    def in_rect(self, x0, y0, x1, y1, contained=False):
+        """Items overlapping the rectangle, or lying fully inside it when contained is set."""
+        qx0, qy0, qx1, qy1 = min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+        ids = self._tree.intersection((qx0, qy0, qx1, qy1))
+        if contained:
+            ids = [
+                i for i in ids
+                if qx0 <= self.bounds[i][0] and qy0 <= self.bounds[i][1]
+                and self.bounds[i][2] <= qx1 and self.bounds[i][3] <= qy1
+            ]
+        return self._result(sorted(ids))
+
+    def nearest(self, x, y, k=1):
+        """The k items closest to the point (ties may return more than k)."""
+        if not self.refs:
+            return []
+        return self._result(self._tree.nearest((x, y, x, y), k))
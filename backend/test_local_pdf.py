@@ -25,13 +25,14 @@ def test_local_pdf_processing():
     if response.status_code == 200:
         print("✅ PDF processed successfully!")
         print(response.json())
+        params = {"doc_id": response.json()["doc_id"]}
     else:
         print(f"❌ Failed to process PDF: {response.text}")
         return
     
     # Step 2: Get reading order
     print("\nGetting reading order...")
-    response = requests.get(f"{API_BASE}/get_reading_order")
+    response = requests.get(f"{API_BASE}/get_reading_order", params=params)
     
     if response.status_code == 200:
         data = response.json()
@@ -43,7 +44,7 @@ def test_local_pdf_processing():
     
     # Step 3: Save complete edited JSON and markdown
     print("\nSaving complete edited JSON and markdown...")
-    response = requests.post(f"{API_BASE}/save_complete_json_and_markdown")
+    response = requests.post(f"{API_BASE}/save_complete_json_and_markdown", params=params)
     
     if response.status_code == 200:
         result = response.json()
@@ -56,7 +57,7 @@ def test_local_pdf_processing():
     
     # Step 4: Download complete edited JSON
     print("\nDownloading complete edited JSON...")
-    response = requests.get(f"{API_BASE}/download_complete_edited_json")
+    response = requests.get(f"{API_BASE}/download_complete_edited_json", params=params)
     
     if response.status_code == 200:
         # Save the JSON file
@@ -69,7 +70,7 @@ def test_local_pdf_processing():
     
     # Step 5: Download complete edited markdown
     print("\nDownloading complete edited markdown...")
-    response = requests.get(f"{API_BASE}/download_complete_edited_markdown")
+    response = requests.get(f"{API_BASE}/download_complete_edited_markdown", params=params)
     
     if response.status_code == 200:
         # Save the markdown file
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script for bulk Wiki.js publishing against a local stub GraphQL server.
+
+Start the stub, then the backend with Settings.WIKI_JS_URL set to
+http://localhost:3999, then run the publish test from backend/ too, since
+the backend only publishes files under its output directory:
+
+    python test_wiki_publish.py --stub          # terminal 1
+    python -m uvicorn main:app                  # terminal 2
+    python test_wiki_publish.py                 # terminal 3
+"""
+
+import json
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+# Configuration
+API_BASE = "http://localhost:8000"
+STUB_PORT = 3999
+STUB_URL = f"http://localhost:{STUB_PORT}"
+PAGE_COUNT = 40
+TEST_DIR = Path("output") / "wiki_publish_test"
+
+
+class StubWikiJs(BaseHTTPRequestHandler):
+    """Just enough of the Wiki.js pages API: create, update and singleByPath."""
+
+    pages = {}  # path -> {"id", "content"}
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    requests_seen = 0
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.requests_seen += 1
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(0.05)  # simulated Wiki.js latency, so concurrency shows up
+            self._reply(self._handle(body["query"], body["variables"]))
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def do_GET(self):
+        # Stats for the test script
+        cls = type(self)
+        with cls.lock:
+            self._reply({"max_in_flight": cls.max_in_flight, "requests": cls.requests_seen, "pages": len(cls.pages)})
+
+    def _handle(self, query, variables):
+        cls = type(self)
+        with cls.lock:
+            if "create(" in query:
+                if variables["path"] in cls.pages:
+                    result = {"succeeded": False, "slug": "PageDuplicateCreate", "message": "Page exists"}
+                    return {"data": {"pages": {"create": {"responseResult": result, "page": None}}}}
+                page_id = len(cls.pages) + 1
+                cls.pages[variables["path"]] = {"id": page_id, "content": variables["content"]}
+                page = {"id": page_id, "path": variables["path"]}
+                return {"data": {"pages": {"create": {"responseResult": {"succeeded": True}, "page": page}}}}
+            if "update(" in query:
+                for path, page in cls.pages.items():
+                    if page["id"] == variables["id"]:
+                        page["content"] = variables["content"]
+                        result = {"responseResult": {"succeeded": True}, "page": {"id": page["id"], "path": path}}
+                        return {"data": {"pages": {"update": result}}}
+                result = {"responseResult": {"succeeded": False, "slug": "PageNotFound"}, "page": None}
+                return {"data": {"pages": {"update": result}}}
+            if "singleByPath(" in query:
+                page = cls.pages.get(variables["path"])
+                return {"data": {"pages": {"singleByPath": page and {"id": page["id"], "path": variables["path"]}}}}
+        return {"errors": [{"message": "Unsupported query"}]}
+
+    def _reply(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_stub():
+    print(f"Stub Wiki.js GraphQL server on {STUB_URL}/graphql")
+    ThreadingHTTPServer(("localhost", STUB_PORT), StubWikiJs).serve_forever()
+
+
+def publish_and_wait(paths):
+    response = requests.post(f"{API_BASE}/publish_to_wiki", json={"paths": paths})
+    if response.status_code != 200:
+        print(f"❌ Failed to start publish job: {response.text}")
+        return None
+    job_id = response.json()["job_id"]
+    while True:
+        job = requests.get(f"{API_BASE}/jobs/{job_id}").json()
+        if job["status"] == "done":
+            return job
+        time.sleep(0.2)
+
+
+def test_bulk_publish():
+    """Publish PAGE_COUNT pages, republish them unchanged, then change one."""
+    TEST_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        test_dir = TEST_DIR.resolve()
+        run = int(time.time())  # fresh page paths, since the backend remembers published pages
+        for i in range(PAGE_COUNT):
+            (test_dir / f"manual_{run}_{i}.md").write_text(f"# Manual {i}\n\nBody of manual {i}.\n", encoding="utf-8")
+
+        print(f"Publishing {PAGE_COUNT} pages...")
+        start = time.perf_counter()
+        job = publish_and_wait([str(test_dir)])
+        if job is None:
+            return
+        print(f"✅ {job['progress']} in {time.perf_counter() - start:.2f}s")
+        stats = requests.get(STUB_URL).json()
+        print(f"Stub saw {stats['requests']} requests, at most {stats['max_in_flight']} in flight")
+
+        print("\nRepublishing unchanged pages...")
+        job = publish_and_wait([str(test_dir)])
+        if job["progress"]["skipped"] == PAGE_COUNT:
+            print(f"✅ All {PAGE_COUNT} pages skipped")
+        else:
+            print(f"❌ Expected every page to be skipped: {job['progress']}")
+
+        print("\nChanging one page and republishing...")
+        changed = test_dir / f"manual_{run}_0.md"
+        changed.write_text("# Manual 0\n\nRevised.\n", encoding="utf-8")
+        job = publish_and_wait([str(test_dir)])
+        if job["progress"]["published"] == 1:
+            print(f"✅ Only the changed page was published: {job['pages'][str(changed)]}")
+        else:
+            print(f"❌ Expected one published page: {job['progress']}")
+    finally:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if "--stub" in sys.argv:
+        run_stub()
+    else:
+        test_bulk_publish()
@@ -1,6 +1,12 @@
 import os
 import json
+import hashlib
+import mimetypes
+import threading
+from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import Settings
 import re
 
@@ -11,69 +17,7 @@ def sanitize_wikijs_path(name):
     name = re.sub(r'[^a-zA-Z0-9-_]', '', name)
     return name.lower()
 
-def upload_markdown_to_wikijs(file_path):
-    print(f"Uploading markdown to Wiki.js: {file_path}")
-    """
-    Uploads the given markdown file to Wiki.js using the GraphQL API.
-    Returns the created Wiki.js page URL if successful, else None.
-    """
-    wiki_js_url = Settings.WIKI_JS_URL.rstrip('/')
-    wiki_js_api_token = Settings.WIKI_JS_API_TOKEN
-    wiki_js_default_path = Settings.WIKI_JS_DEFAULT_PATH.lstrip('/')
-
-    # Extract filename for title and slug
-    file_name = os.path.splitext(os.path.basename(file_path))[0]
-    safe_file_name = sanitize_wikijs_path(file_name)
-    page_title = f"{safe_file_name}"
-    page_path = f"{wiki_js_default_path}/{safe_file_name}"
-
-    headers = {
-        "Authorization": f"Bearer {wiki_js_api_token}",
-        "Content-Type": "application/json",
-    }
-
-    # Read markdown content
-    with open(file_path, 'r', encoding='utf-8') as f:
-        markdown_content = f.read()
-
-    # First, try to get the existing page ID
-    get_page_query = """
-    query($path: String!) {
-        pages {
-            single(path: $path) {
-                id
-                path
-                title
-            }
-        }
-    }
-    """
-
-    # Try to create the page first
-    create_query = """
-    mutation(
-        $title: String!,
-        $content: String!,
-        $path: String!,
-        $description: String!,
-        $editor: String!,
-        $locale: String!,
-        $isPublished: Boolean!,
-        $isPrivate: Boolean!,
-        $tags: [String]!
-    ) {
-        pages {
-            create(
-                title: $title
-                content: $content
-                path: $path
-                description: $description
-                editor: $editor
-                locale: $locale
-                isPublished: $isPublished
-                isPrivate: $isPrivate
-                tags: $tags
-            ) {
+PAGE_FIELDS = """
                 responseResult {
                     succeeded
                     slug
@@ -83,162 +27,294 @@ def upload_markdown_to_wikijs(file_path):
                     id
                     path
                 }
-            }
+"""
+
+GET_PAGE_QUERY = """
+query($path: String!, $locale: String!) {
+    pages {
+        singleByPath(path: $path, locale: $locale) {
+            id
+            path
         }
     }
+}
+"""
+
+CREATE_QUERY = """
+mutation(
+    $title: String!,
+    $content: String!,
+    $path: String!,
+    $description: String!,
+    $editor: String!,
+    $locale: String!,
+    $isPublished: Boolean!,
+    $isPrivate: Boolean!,
+    $tags: [String]!
+) {
+    pages {
+        create(
+            title: $title
+            content: $content
+            path: $path
+            description: $description
+            editor: $editor
+            locale: $locale
+            isPublished: $isPublished
+            isPrivate: $isPrivate
+            tags: $tags
+        ) {%s}
+    }
+}
+""" % PAGE_FIELDS
+
+UPDATE_QUERY = """
+mutation(
+    $id: Int!,
+    $title: String!,
+    $content: String!,
+    $description: String!,
+    $editor: String!,
+    $locale: String!,
+    $isPublished: Boolean!,
+    $isPrivate: Boolean!,
+    $tags: [String]!
+) {
+    pages {
+        update(
+            id: $id
+            title: $title
+            content: $content
+            description: $description
+            editor: $editor
+            locale: $locale
+            isPublished: $isPublished
+            isPrivate: $isPrivate
+            tags: $tags
+        ) {%s}
+    }
+}
+""" % PAGE_FIELDS
+
+
+class WikiJsError(Exception):
+    """A Wiki.js request that failed or was rejected."""
+
+
+class WikiJsClient:
     """
+    Wiki.js GraphQL client on one pooled requests.Session, with timeouts and
+    retries (exponential backoff) for connection errors and 429/5xx replies.
 
-    # Update query for existing pages
-    update_query = """
-    mutation(
-        $id: Int!,
-        $title: String!,
-        $content: String!,
-        $description: String!,
-        $editor: String!,
-        $locale: String!,
-        $isPublished: Boolean!,
-        $isPrivate: Boolean!,
-        $tags: [String]!
-    ) {
-        pages {
-            update(
-                id: $id
-                title: $title
-                content: $content
-                description: $description
-                editor: $editor
-                locale: $locale
-                isPublished: $isPublished
-                isPrivate: $isPrivate
-                tags: $tags
-            ) {
-                responseResult {
-                    succeeded
-                    slug
-                    message
-                }
-                page {
-                    id
-                    path
-                }
-            }
+    Page ids are remembered per path in id_cache_path, so publishing a page
+    that was published before is a single update request, and a new page is a
+    single create. Only a page created elsewhere costs a lookup first. The
+    cache also keeps a hash of the last published content, which lets
+    publish() skip unchanged pages without any request, and the names of
+    uploaded assets, which are content-addressed and uploaded once.
+    """
+
+    def __init__(self, url, token, default_path="", id_cache_path=None,
+                 timeout=(5, 60), retries=3, backoff=0.5, pool_size=10):
+        self.url = url.rstrip('/')
+        self.default_path = default_path.strip('/')
+        self.endpoint = f"{self.url}/graphql"
+        self.timeout = timeout
+        self.session = requests.Session()
+        # No session-wide Content-Type: GraphQL calls send JSON, asset uploads multipart
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.id_cache_path = Path(id_cache_path) if id_cache_path else None
+        self._pages = {}  # path -> {"id": page id, "sha256": hash of the last published content}
+        self._assets = set()  # names of files uploaded to the asset root
+        self._pages_lock = threading.Lock()
+        if self.id_cache_path and self.id_cache_path.exists():
+            with open(self.id_cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            self._pages = cached.get("pages", {})
+            self._assets = set(cached.get("assets", []))
+
+    def page_path(self, name):
+        safe_name = sanitize_wikijs_path(name)
+        return f"{self.default_path}/{safe_name}" if self.default_path else safe_name
+
+    def page_url(self, path):
+        return f"{self.url}/{path.lstrip('/')}"
+
+    def _save_cache(self):
+        if self.id_cache_path:
+            tmp_path = self.id_cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"pages": self._pages, "assets": sorted(self._assets)}, f)
+            os.replace(tmp_path, self.id_cache_path)
+
+    def _remember(self, path, page_id, content_hash=None):
+        with self._pages_lock:
+            if page_id is None:
+                self._pages.pop(path, None)
+            else:
+                self._pages[path] = {"id": page_id, "sha256": content_hash}
+            self._save_cache()
+
+    def _graphql(self, query, variables):
+        try:
+            response = self.session.post(
+                self.endpoint, json={"query": query, "variables": variables}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            result = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise WikiJsError(f"Wiki.js request failed: {e}") from e
+        if "errors" in result:
+            raise WikiJsError("; ".join(str(error.get("message", error)) for error in result["errors"]))
+        return result.get("data") or {}
+
+    def _mutate(self, query, operation, variables):
+        data = self._graphql(query, variables).get("pages", {}).get(operation) or {}
+        return data.get("responseResult") or {}, data.get("page") or {}
+
+    def _lookup_id(self, path, locale):
+        page = self._graphql(GET_PAGE_QUERY, {"path": path, "locale": locale}).get("pages", {}).get("singleByPath")
+        return int(page["id"]) if page and page.get("id") is not None else None
+
+    def upsert(self, path, title, content, description="", tags=(), locale="en"):
+        """
+        Create or update the page at path. Returns {"url", "id", "action"}
+        with action "created" or "updated"; raises WikiJsError on failure.
+        """
+        variables = {
+            "title": title,
+            "content": content,
+            "description": description,
+            "editor": "markdown",
+            "locale": locale,
+            "isPublished": True,
+            "isPrivate": False,
+            "tags": list(tags),
         }
-    }
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        page_id = self._pages.get(path, {}).get("id")
+        if page_id is None:
+            result, page = self._mutate(CREATE_QUERY, "create", {**variables, "path": path})
+            if result.get("succeeded"):
+                page_id = int(page["id"]) if page.get("id") is not None else None
+                self._remember(path, page_id, content_hash)
+                return {"url": self.page_url(page.get("path") or path), "id": page_id, "action": "created"}
+            if result.get("slug") != "PageDuplicateCreate":
+                raise WikiJsError(f"Create failed: {result.get('message') or result.get('slug')}")
+            # Created outside this client: learn its id once, then update
+            page_id = self._lookup_id(path, locale)
+            if page_id is None:
+                raise WikiJsError(f"Page {path} exists but could not be looked up")
+
+        result, page = self._mutate(UPDATE_QUERY, "update", {**variables, "id": page_id})
+        if not result.get("succeeded"):
+            # A stale id (page deleted or moved in Wiki.js) is forgotten, so the next publish creates it again
+            self._remember(path, None)
+            raise WikiJsError(f"Update failed: {result.get('message') or result.get('slug')}")
+        self._remember(path, page_id, content_hash)
+        return {"url": self.page_url(page.get("path") or path), "id": page_id, "action": "updated"}
+
+    def upload_asset(self, file_path, folder_id=0):
+        """
+        Upload a file to the Wiki.js asset store (multipart POST to /u) and
+        return the path pages link it by. A name uploaded before is not sent
+        again, so callers should use content-addressed names.
+        """
+        name = os.path.basename(file_path)
+        if name not in self._assets:
+            mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            with open(file_path, "rb") as f:
+                files = [
+                    ("mediaUpload", (None, json.dumps({"folderId": folder_id}))),
+                    ("mediaUpload", (name, f, mimetype)),
+                ]
+                try:
+                    response = self.session.post(f"{self.url}/u", files=files, timeout=self.timeout)
+                    response.raise_for_status()
+                except requests.exceptions.RequestException as e:
+                    raise WikiJsError(f"Asset upload of {name} failed: {e}") from e
+            with self._pages_lock:
+                self._assets.add(name)
+                self._save_cache()
+        return f"/{name}"
+
+    def publish(self, path, title, content, **kwargs):
+        """upsert(), unless content is what was last published to path (action "unchanged", no request)."""
+        known = self._pages.get(path, {})
+        if known.get("id") is not None and known.get("sha256") == hashlib.sha256(content.encode("utf-8")).hexdigest():
+            return {"url": self.page_url(path), "id": known["id"], "action": "unchanged"}
+        return self.upsert(path, title, content, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_wikijs_client():
+    """The process-wide client for the configured Wiki.js instance, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WikiJsClient(
+                Settings.WIKI_JS_URL,
+                Settings.WIKI_JS_API_TOKEN,
+                Settings.WIKI_JS_DEFAULT_PATH,
+                id_cache_path=Path("output") / "wikijs_page_ids.json",
+            )
+        return _client
+
+ASSET_LINK = re.compile(r'\]\((assets/[^)\s]+)\)')
+
+def publish_markdown_file(file_path, assets_dir=None):
+    """
+    Publish a markdown file to the Wiki.js page named after it, skipping it if
+    it is unchanged since the last publish. With assets_dir, images linked as
+    assets/<name> are uploaded to the Wiki.js asset store first and the links
+    rewritten to point there. Returns {"url", "id", "action"}; raises
+    WikiJsError on failure.
     """
+    client = get_wikijs_client()
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    safe_file_name = sanitize_wikijs_path(file_name)
+    page_path = client.page_path(file_name)
 
-    variables = {
-        "title": page_title,
-        "content": markdown_content,
-        "path": page_path,
-        "description": f"Auto-generated content from {safe_file_name}",
-        "editor": "markdown",
-        "locale": "en",
-        "isPublished": True,
-        "isPrivate": False,
-        "tags": ["auto-generated", "gemini-ai"]
-    }
+    with open(file_path, 'r', encoding='utf-8') as f:
+        markdown_content = f.read()
+
+    if assets_dir is not None:
+        uploaded = {
+            link: client.upload_asset(os.path.join(assets_dir, os.path.basename(link)))
+            for link in set(ASSET_LINK.findall(markdown_content))
+        }
+        markdown_content = ASSET_LINK.sub(lambda m: f"]({uploaded[m.group(1)]})", markdown_content)
 
-    wiki_js_api_endpoint = f"{wiki_js_url}/graphql"
+    page = client.publish(
+        page_path,
+        title=safe_file_name,
+        content=markdown_content,
+        description=f"Auto-generated content from {safe_file_name}",
+        tags=["auto-generated", "gemini-ai"],
+    )
+    print(f"Wiki.js page {page['action']}: {page['url']} ({len(markdown_content)} chars)")
+    return page
 
+def upload_markdown_to_wikijs(file_path, assets_dir=None):
+    """
+    Uploads the given markdown file to Wiki.js using the GraphQL API.
+    Returns the created or updated Wiki.js page URL if successful, else None.
+    """
     try:
-        # First try to create the page
-        wiki_response = requests.post(wiki_js_api_endpoint, json={
-            "query": create_query,
-            "variables": variables
-        }, headers=headers)
-        wiki_response.raise_for_status()
-
-        result = wiki_response.json()
-        print("Wiki.js API response:", json.dumps(result, indent=2))
-        
-        if "errors" in result:
-            print("Error uploading to Wiki.js:", json.dumps(result["errors"], indent=2))
-            return None
-        
-        page_data = result.get('data', {}).get('pages', {}).get('create', {})
-        response_result = page_data.get('responseResult', {})
-        
-        if response_result.get('succeeded'):
-            # Page created successfully
-            page_path = page_data.get('page', {}).get('path', '')
-            full_url = f"{wiki_js_url}/{page_path.lstrip('/')}"
-            print(f"\nSuccessfully created Wiki.js page!")
-            print(f"Page URL: {full_url}")
-            return full_url
-        elif response_result.get('slug') == 'PageDuplicateCreate':
-            # Page already exists, try to update it
-            print("Page already exists, attempting to update...")
-            
-            # Get the existing page ID
-            get_response = requests.post(wiki_js_api_endpoint, json={
-                "query": get_page_query,
-                "variables": {"path": page_path}
-            }, headers=headers)
-            get_response.raise_for_status()
-            
-            get_result = get_response.json()
-            if "errors" in get_result:
-                print("Error getting existing page:", json.dumps(get_result["errors"], indent=2))
-                return None
-            
-            existing_page = get_result.get('data', {}).get('pages', {}).get('single')
-            if not existing_page:
-                print("Could not find existing page to update")
-                return None
-            
-            page_id = existing_page.get('id')
-            print(f"Fetched page_id: {page_id} (type: {type(page_id)})")
-            if not page_id:
-                print("Could not get page ID for update")
-                return None
-            # Ensure page_id is an integer
-            try:
-                page_id = int(page_id)
-            except Exception as e:
-                print(f"Error converting page_id to int: {e}")
-                return None
-            
-            # Update the existing page
-            update_variables = {
-                "id": page_id,
-                "title": page_title,
-                "content": markdown_content,
-                "description": f"Auto-generated content from {safe_file_name}",
-                "editor": "markdown",
-                "locale": "en",
-                "isPublished": True,
-                "isPrivate": False,
-                "tags": ["auto-generated", "gemini-ai"]
-            }
-            
-            update_response = requests.post(wiki_js_api_endpoint, json={
-                "query": update_query,
-                "variables": update_variables
-            }, headers=headers)
-            update_response.raise_for_status()
-            
-            update_result = update_response.json()
-            print("Update response:", json.dumps(update_result, indent=2))
-            
-            if "errors" in update_result:
-                print("Error updating page:", json.dumps(update_result["errors"], indent=2))
-                return None
-            
-            update_page_data = update_result.get('data', {}).get('pages', {}).get('update', {})
-            if update_page_data.get('responseResult', {}).get('succeeded'):
-                page_path = update_page_data.get('page', {}).get('path', '')
-                full_url = f"{wiki_js_url}/{page_path.lstrip('/')}"
-                print(f"\nSuccessfully updated Wiki.js page!")
-                print(f"Page URL: {full_url}")
-                return full_url
-            else:
-                print("Failed to update page:", json.dumps(update_page_data.get('responseResult', {}), indent=2))
-                return None
-        else:
-            print("Failed to create page:", json.dumps(response_result, indent=2))
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred while connecting to Wiki.js: {e}")
-        return None 
\ No newline at end of file
+        return publish_markdown_file(file_path, assets_dir)["url"]
+    except WikiJsError as e:
+        print(f"Wiki.js upload of {file_path} failed: {e}")
+        return None
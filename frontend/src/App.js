@@ -20,6 +20,12 @@ function App() {
   const [correctedPages, setCorrectedPages] = useState({});
   const [sidebarOpen, setSidebarOpen] = useState(true);
   const [editedBoxes, setEditedBoxes] = useState({}); // Store edited boxes for each page
+  const [pagesReady, setPagesReady] = useState(0); // Pages whose boxes the backend has written
+  const [processingJob, setProcessingJob] = useState(null);
+  const [docId, setDocId] = useState(null); // Backend session id of the uploaded document
+  const [imageVersion, setImageVersion] = useState(''); // Versions page image URLs so the browser can cache them
+  const [overlayRects, setOverlayRects] = useState([]); // Box overlay in page-image pixels, drawn by PDFViewer
+  const [boxesVersion, setBoxesVersion] = useState(0); // Bumped to refetch boxes after a server-side reorder
   const fileInputRef = useRef();
 
   // Handle PDF upload
@@ -32,34 +38,78 @@ function App() {
     setUploading(true);
     setOrderSaved(false);
     setCorrectedPages({});
-    const formData = new FormData();
-    formData.append('file', pdfFile);
+    setPagesReady(0);
     try {
-      await axios.post(`${API_BASE}/upload_pdf`, formData, {
-        headers: { 'Content-Type': 'multipart/form-data' },
+      // Raw body upload: the backend streams it to disk and hashes it as it arrives
+      const res = await axios.post(`${API_BASE}/upload_pdf`, pdfFile, {
+        headers: { 'Content-Type': 'application/pdf' },
+        // The box overlay is drawn here, so the backend skips rendering annotated images
+        params: { filename: pdfFile.name, overlay: 'client' },
       });
-      const res = await axios.get(`${API_BASE}/pages_count`);
-      setPagesCount(res.data.pages);
-      setCurrentPage(0);
+      setDocId(res.data.doc_id);
+      setImageVersion(res.data.image_version);
+      setProcessingJob(res.data.job_id);
     } catch (err) {
-      alert('Upload failed.');
+      alert(err.response?.status === 413 ? 'PDF is too large to upload.' : 'Upload failed.');
+      setUploading(false);
     }
-    setUploading(false);
   };
 
+  // Poll the processing job; show page 0 as soon as its boxes are written
+  useEffect(() => {
+    if (!processingJob) return;
+    let cancelled = false;
+    let shown = false;
+    const poll = async () => {
+      try {
+        const { data: job } = await axios.get(`${API_BASE}/jobs/${processingJob}`);
+        if (cancelled) return;
+        if (job.status === 'failed') {
+          alert(job.error || 'Upload failed.');
+          setProcessingJob(null);
+          setUploading(false);
+          return;
+        }
+        const { boxes_written, pages_total } = job.progress;
+        if (boxes_written > 0 && !shown) {
+          shown = true;
+          setPagesCount(pages_total);
+          setCurrentPage(0);
+          setUploading(false);
+        }
+        setPagesReady(boxes_written);
+        if (job.status === 'done') {
+          setProcessingJob(null);
+          return;
+        }
+      } catch (err) {
+        if (cancelled) return;
+      }
+      setTimeout(poll, 1000);
+    };
+    poll();
+    return () => { cancelled = true; };
+  }, [processingJob]);
+
   // Fetch page image and boxes when currentPage changes
   useEffect(() => {
-    if (pagesCount === 0) return;
+    if (pagesCount === 0 || !docId) return;
     setLoadingPage(true);
     setOrderSaved(false);
     
-    const annotatedImageUrl = `${API_BASE}/annotated_page_image/${currentPage}?${Date.now()}`;
-    console.log('Loading annotated image:', annotatedImageUrl);
-    setImageUrl(annotatedImageUrl);
+    setImageUrl(`${API_BASE}/page_image/${currentPage}?doc_id=${docId}&v=${imageVersion}`);
+    axios.get(`${API_BASE}/page_overlay/${currentPage}`, { params: { doc_id: docId } })
+      .then(res => setOverlayRects(res.data.rects))
+      .catch(() => setOverlayRects([]));
     
-    axios.get(`${API_BASE}/bounding_boxes/${currentPage}`)
+    axios.get(`${API_BASE}/bounding_boxes/${currentPage}`, { params: { doc_id: docId } })
       .then(res => {
-        const fetchedBoxes = res.data;
+        // Picture blocks reference the backend's /picture endpoint rather than inlining the image
+        const fetchedBoxes = res.data.map(box =>
+          typeof box.content === 'string' && box.content.startsWith('/picture/')
+            ? { ...box, content: `${API_BASE}${box.content}` }
+            : box
+        );
         setBoxes(fetchedBoxes);
         setOriginalBoxes(fetchedBoxes);
         // Store original boxes for this page if not already stored
@@ -70,7 +120,26 @@ function App() {
       })
       .catch(() => setBoxes([]))
       .finally(() => setLoadingPage(false));
-  }, [currentPage, pagesCount]);
+  }, [currentPage, pagesCount, docId, imageVersion, boxesVersion]);
+
+  // Let the backend propose a reading order for every page from block geometry
+  const handleAutoOrder = async () => {
+    try {
+      await axios.post(`${API_BASE}/auto_reading_order`, null, { params: { doc_id: docId } });
+      setEditedBoxes({});
+      setCorrectedPages({});
+      setBoxesVersion(v => v + 1);
+    } catch (err) {
+      alert('Automatic ordering failed.');
+    }
+  };
+
+  // Autosave a batch of edit operations; the backend applies them in place and logs them
+  const sendPatch = (ops) => {
+    if (!docId || ops.length === 0) return;
+    axios.post(`${API_BASE}/save_order_patch`, { ops }, { params: { doc_id: docId } })
+      .catch(err => console.error('Error autosaving edits:', err));
+  };
 
   // Drag-and-drop reorder
   const onDragEnd = (result) => {
@@ -95,6 +164,14 @@ function App() {
     
     setBoxes(reordered);
 
+    const previous = reordered[destination.index - 1];
+    const next = reordered[destination.index + 1];
+    if (previous) {
+      sendPatch([{ op: 'move', ref: removed.self_ref, after: previous.self_ref }]);
+    } else if (next) {
+      sendPatch([{ op: 'move', ref: removed.self_ref, before: next.self_ref }]);
+    }
+
     // Update edited boxes state for the current page
     setEditedBoxes(prev => ({
       ...prev,
@@ -106,6 +183,12 @@ function App() {
 
   // Handle block updates (content editing)
   const handleBlockUpdate = (updatedBoxes) => {
+    const previousContent = {};
+    boxes.forEach(box => { previousContent[box.self_ref] = box.content; });
+    sendPatch(updatedBoxes
+      .filter(box => box.type === 'text' && box.content !== previousContent[box.self_ref])
+      .map(box => ({ op: 'edit_text', ref: box.self_ref, text: box.content })));
+
     setBoxes(updatedBoxes);
     
     // Update edited boxes state for the current page
@@ -128,7 +211,7 @@ function App() {
       ...prev,
       [currentPage]: boxes
     }));
-    if (currentPage < pagesCount - 1) {
+    if (currentPage < pagesReady - 1) {
       setCurrentPage(currentPage + 1);
     }
   };
@@ -185,13 +268,14 @@ function App() {
       
       console.log("Order Data", orderData)
       // Save orders and texts
-      await axios.post(`${API_BASE}/save_all_orders`, orderData);
+      await axios.post(`${API_BASE}/save_all_orders`, orderData, { params: { doc_id: docId } });
       
       // Now save complete edited JSON and generate markdown
-      const result = await axios.post(`${API_BASE}/save_complete_json_and_markdown`);
+      const result = await axios.post(`${API_BASE}/save_complete_json_and_markdown`, null, { params: { doc_id: docId } });
       console.log("Result save all", result)
       // Download the complete edited JSON
       const jsonResponse = await axios.get(`${API_BASE}/download_complete_edited_json`, {
+        params: { doc_id: docId },
         responseType: 'blob'
       });
       
@@ -227,13 +311,14 @@ function App() {
       });
       
       // Save orders and texts
-      await axios.post(`${API_BASE}/save_all_orders`, orderData);
+      await axios.post(`${API_BASE}/save_all_orders`, orderData, { params: { doc_id: docId } });
       
       // Now save complete edited JSON and generate markdown
-      await axios.post(`${API_BASE}/save_complete_json_and_markdown`);
+      await axios.post(`${API_BASE}/save_complete_json_and_markdown`, null, { params: { doc_id: docId } });
       
       // Download the complete edited markdown
       const res = await axios.get(`${API_BASE}/download_complete_edited_markdown`, {
+        params: { doc_id: docId },
         responseType: 'blob'
       });
       
@@ -251,9 +336,9 @@ function App() {
   const handleOpenInWiki = async () => {
     try {
       // Ensure backend has the latest markdown
-      await axios.post(`${API_BASE}/save_complete_json_and_markdown`);
+      await axios.post(`${API_BASE}/save_complete_json_and_markdown`, null, { params: { doc_id: docId } });
       // Trigger Wiki.js upload
-      const res = await axios.post(`${API_BASE}/upload_to_wiki`);
+      const res = await axios.post(`${API_BASE}/upload_to_wiki`, null, { params: { doc_id: docId } });
       const { wiki_url } = res.data;
       if (wiki_url) {
         window.open(wiki_url, '_blank');
@@ -269,7 +354,7 @@ function App() {
 
   // Navigation
   const goPrev = () => setCurrentPage((p) => Math.max(0, p - 1));
-  const goNext = () => setCurrentPage((p) => Math.min(pagesCount - 1, p + 1));
+  const goNext = () => setCurrentPage((p) => Math.min(Math.max(pagesReady, 1) - 1, p + 1));
 
   // Toggle sidebar
   const toggleSidebar = () => setSidebarOpen(!sidebarOpen);
@@ -315,6 +400,14 @@ function App() {
             >
               {uploading ? 'Uploading...' : 'Upload PDF'}
             </button>
+            <button
+              onClick={handleAutoOrder}
+              disabled={!docId || processingJob !== null}
+              className="upload-btn"
+              title="Order blocks by page layout (columns, then top to bottom)"
+            >
+              Auto order
+            </button>
           </div>
         </div>
       </div>
@@ -353,6 +446,7 @@ function App() {
             orderSaved={orderSaved}
             boxes={boxes}
             originalBoxes={originalBoxes}
+            overlayRects={overlayRects}
           />
           {/* Show Save All and Export to Markdown when all pages are corrected */}
           {allPagesCorrected && (
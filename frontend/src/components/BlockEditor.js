@@ -131,6 +131,9 @@ const blockTypeConfig = {
   
 };
 
+// Inline base64 images and picture URLs served by the backend
+const isImageSource = (content) => content.startsWith('data:image/') || /^https?:\/\/.*\/picture\/\d+/.test(content);
+
 const BlockEditor = ({
   block,
   isSelected,
@@ -269,7 +272,7 @@ const BlockEditor = ({
       return (
         <div className="space-y-3">
           <div className="relative overflow-hidden rounded-xl bg-gray-100">
-            {block.content && block.content.startsWith('data:image/') ? (
+            {block.content && isImageSource(block.content) ? (
               <img
                 src={block.content}
                 alt={block.metadata?.caption || 'Image'}
@@ -292,7 +295,7 @@ const BlockEditor = ({
             </p>
           )}
           {/* Show image info if it's a reference */}
-          {block.content && !block.content.startsWith('data:image/') && (
+          {block.content && !isImageSource(block.content) && (
             <p className="text-xs text-gray-500">
               Image Reference: {block.content}
             </p>
@@ -96,6 +96,46 @@ const ReadingOrderOverlay = ({ boxes, imageWidth, imageHeight, displayedWidth, d
   );
 };
 
+// Box overlay drawn over the plain page image; rects are in the image's natural pixel space
+const BoxOverlay = ({ rects, imageWidth, imageHeight, displayedWidth, displayedHeight }) => {
+  if (!displayedWidth || !displayedHeight || !imageWidth || !imageHeight) {
+    return null;
+  }
+  const scaleX = displayedWidth / imageWidth;
+  const scaleY = displayedHeight / imageHeight;
+
+  return (
+    <div
+      className="box-overlay"
+      style={{
+        width: displayedWidth,
+        height: displayedHeight,
+        position: 'absolute',
+        top: 0,
+        left: 0,
+        pointerEvents: 'none'
+      }}
+    >
+      {rects.map((rect, index) => (
+        <div
+          key={`${rect.self_ref}-${index}`}
+          style={{
+            position: 'absolute',
+            left: `${rect.x * scaleX}px`,
+            top: `${rect.y * scaleY}px`,
+            width: `${rect.w * scaleX}px`,
+            height: `${rect.h * scaleY}px`,
+            // Same look as the server-drawn overlay: light blue fill, black edge, 30% opacity
+            background: 'rgba(162, 207, 254, 0.3)',
+            border: '1px solid rgba(0, 0, 0, 0.3)',
+            boxSizing: 'border-box'
+          }}
+        />
+      ))}
+    </div>
+  );
+};
+
 const PDFViewer = ({
   imageUrl,
   loadingPage,
@@ -110,7 +150,8 @@ const PDFViewer = ({
   allPagesCorrected,
   orderSaved,
   boxes = [],
-  originalBoxes = []
+  originalBoxes = [],
+  overlayRects = []
 }) => {
   const [imageLoaded, setImageLoaded] = React.useState(false);
   const [imageDimensions, setImageDimensions] = React.useState({ width: 0, height: 0 });
@@ -254,6 +295,16 @@ const PDFViewer = ({
                 maxHeight: 'none'
               }}
             />
+            {imageLoaded && overlayRects.length > 0 && displayedDimensions.width > 0 && (
+              <BoxOverlay
+                key={`boxes-${overlayKey}`}
+                rects={overlayRects}
+                imageWidth={imageDimensions.width}
+                imageHeight={imageDimensions.height}
+                displayedWidth={displayedDimensions.width}
+                displayedHeight={displayedDimensions.height}
+              />
+            )}
             {imageLoaded && boxes.length > 0 && displayedDimensions.width > 0 && displayedDimensions.height > 0 && (
               <ReadingOrderOverlay
                 key={overlayKey} // Force re-render when dimensions change